@@ -0,0 +1,171 @@
+import logging
+import multiprocessing
+import os
+import pathlib
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from .prairie_view_loader import PrairieViewMeta
+from .scanimage_utils import get_scanimage_acq_time, read_scanimage_header
+
+logger = logging.getLogger(__name__)
+
+_row_keys = (
+    "path",
+    "acq_software",
+    "file_size",
+    "file_mtime",
+    "recording_time",
+    "metadata",
+    "error",
+)
+
+
+def extract_acquisition_metadata(
+    paths: list, n_workers: int = None, cache_file: str = None
+) -> list:
+    """Extract the metadata of many acquisitions, in parallel worker processes
+
+    Each path is dispatched to the parser of its acquisition software:
+        - PrairieView: a directory or `.xml` file of a PrairieView dataset, or one
+          of its `.ome.tif` files (see `prairie_view_loader.PrairieViewMeta`)
+        - ScanImage: a `.tif` file with a ScanImage header (see
+          `scanimage_utils.read_scanimage_header`)
+
+    An error in one acquisition is captured in the "error" column of its row
+    instead of being raised. If `cache_file` is given, the rows extracted without
+    error are saved to it, and reused while the size and modification time of the
+    acquisition (its `.xml` files for a PrairieView directory) are unchanged, so
+    only new or modified acquisitions are parsed on the next call.
+
+    Example:
+        > rows = extract_acquisition_metadata(session_paths, cache_file="catalog.pickle")
+        > failed = [row["path"] for row in rows if row["error"]]
+        > pandas.DataFrame(rows)  # or `ScanTable.insert(rows, ...)`
+
+    Args:
+        paths (list): paths of the acquisitions
+        n_workers (int): number of worker processes. Defaults to number of cores.
+        cache_file (str): optional path of the results cache (pickle)
+
+    Returns:
+        rows (list): one dict per path, in order, with keys: path, acq_software
+            ("PrairieView" or "ScanImage"), file_size, file_mtime, recording_time
+            and metadata (dict) from the vendor parser, error (str or None)
+    """
+    paths = [pathlib.Path(path).as_posix() for path in paths]
+    cache = _load_metadata_cache(cache_file) if cache_file else {}
+
+    rows = {}
+    todo = []
+    for path in paths:
+        file_stat = _get_acquisition_stat(path)
+        cached_row = cache.get(path)
+        if (
+            file_stat is not None
+            and cached_row is not None
+            and (cached_row["file_size"], cached_row["file_mtime"]) == file_stat
+        ):
+            rows[path] = cached_row
+        elif path not in rows:
+            todo.append(path)
+            rows[path] = None
+
+    n_workers = n_workers or multiprocessing.cpu_count()
+    if n_workers == 1 or len(todo) <= 1:
+        new_rows = list(map(_extract_metadata, todo))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(n_workers, len(todo)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            new_rows = list(
+                executor.map(
+                    _extract_metadata,
+                    todo,
+                    chunksize=max(1, min(64, len(todo) // (4 * n_workers))),
+                )
+            )
+    rows.update((row["path"], row) for row in new_rows)
+
+    if cache_file and todo:
+        cache.update({path: row for path, row in rows.items() if row["error"] is None})
+        _save_metadata_cache(cache_file, cache)
+
+    return [rows[path] for path in paths]
+
+
+def _extract_metadata(path: str) -> dict:
+    """Row of `extract_acquisition_metadata` for one path, run in a worker process"""
+    row = dict.fromkeys(_row_keys)
+    row["path"] = path
+    try:
+        file_stat = _get_acquisition_stat(path)
+        if file_stat is None:
+            raise FileNotFoundError(f"{path} does not exist")
+        row["file_size"], row["file_mtime"] = file_stat
+        row["acq_software"] = _get_acq_software(path)
+        if row["acq_software"] == "ScanImage":
+            row["metadata"] = read_scanimage_header(path)
+            if "epoch" in row["metadata"]:
+                row["recording_time"] = get_scanimage_acq_time(path)
+        else:
+            path = pathlib.Path(path)
+            # no sidecar caches in the (possibly read-only) acquisition directory
+            row["metadata"] = PrairieViewMeta(
+                path if path.is_dir() else path.parent,
+                cache_frame_index=False,
+                cache_page_index=False,
+            ).meta
+            row["recording_time"] = row["metadata"]["recording_time"]
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def _get_acq_software(path: str) -> str:
+    path = pathlib.Path(path)
+    if path.is_dir() or path.suffix.lower() == ".xml":
+        return "PrairieView"
+    if path.suffix.lower() not in (".tif", ".tiff"):
+        raise ValueError(f"Unknown acquisition software of {path}")
+    if not path.name.lower().endswith(".ome.tif") and any(
+        key.startswith("SI") for key in read_scanimage_header(path, typed=False)
+    ):
+        return "ScanImage"
+    return "PrairieView"  # .ome.tif files next to the PrairieView .xml file
+
+
+def _get_acquisition_stat(path: str):
+    """(size, mtime) of a file, or of the .xml files of a directory, None if missing"""
+    try:
+        if os.path.isdir(path):
+            file_stats = [os.stat(f) for f in pathlib.Path(path).glob("*.xml")]
+            return (
+                sum(file_stat.st_size for file_stat in file_stats),
+                max((file_stat.st_mtime_ns for file_stat in file_stats), default=0),
+            )
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+    return file_stat.st_size, file_stat.st_mtime_ns
+
+
+def _load_metadata_cache(cache_file: str) -> dict:
+    if not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, "rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable metadata cache {cache_file}: {e}")
+        return {}
+
+
+def _save_metadata_cache(cache_file: str, cache: dict):
+    try:
+        with open(f"{cache_file}.tmp", "wb") as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{cache_file}.tmp", cache_file)
+    except OSError as e:
+        logger.warning(f"Unable to write metadata cache {cache_file}: {e}")
@@ -482,54 +482,50 @@ def _process_scanimage_tiff(scan_filenames, output_dir="./", split_depths=False)
     Read ScanImage TIFF - reshape into volumetric data based on scanning depths/channels
     Save new TIFF files for each channel - with shape (frame x height x width x depth)
     """
-    import scanreader
-    from tifffile import imsave
+    from tifffile import TiffWriter
+
+    from .scanimage_loader import ScanImageTiff
 
     # ------------ CaImAn multi-channel multi-plane tiff file ------------
     for scan_filename in tqdm(scan_filenames):
-        scan = scanreader.read_scan(scan_filename)
-        cm_movie = cm.load(scan_filename)
-
-        # ---- Volumetric movie: (depth x height x width x channel x frame) ----
         # tiff pages are ordered as:
         # ch0-pln0-t0, ch1-pln0-t0, ch0-pln1-t0, ch1-pln1-t0, ..., ch0-pln1-t5, ch1-pln1-t5, ...
-
-        vol_timeseries = np.full(
-            (
-                scan.num_scanning_depths,
-                scan.image_height,
-                scan.image_width,
-                scan.num_channels,
-                scan.num_frames,
-            ),
-            0,
-        ).astype(scan.dtype)
-        for pln_idx in range(scan.num_scanning_depths):
-            for chn_idx in range(scan.num_channels):
-                pln_chn_ind = np.arange(
-                    pln_idx * scan.num_channels + chn_idx,
-                    scan._num_pages,
-                    scan.num_scanning_depths * scan.num_channels,
-                )
-                vol_timeseries[pln_idx, :, :, chn_idx, :] = cm_movie[
-                    pln_chn_ind, :, :
-                ].transpose(1, 2, 0)
+        # read as memory-mapped (frame x height x width) views per plane and channel
+        si_tiff = ScanImageTiff(scan_filename)
 
         # save volumetric movie for individual channel
         output_dir = pathlib.Path(output_dir)
         fname = pathlib.Path(scan_filename).stem
 
-        for chn_idx in range(scan.num_channels):
-            if scan.num_scanning_depths == 1:
-                chn_vol = (
-                    vol_timeseries[0, :, :, chn_idx, :].squeeze().transpose(2, 0, 1)
-                )  # (frame x height x width)
-            else:
-                chn_vol = vol_timeseries[:, :, :, chn_idx, :].transpose(
-                    3, 1, 2, 0
-                )  # (frame x height x width x depth)
+        for chn_idx, channel in enumerate(si_tiff.channels):
+            pln_movies = [
+                si_tiff.get_movie(pln_idx, channel)
+                for pln_idx in range(si_tiff.num_planes)
+            ]
+            num_frames = min(len(pln_movie) for pln_movie in pln_movies)
+            # (frame x height x width) or (frame x height x width x depth)
+            chn_shape = (num_frames, *si_tiff.frame_shape)
+            if si_tiff.num_planes > 1:
+                chn_shape += (si_tiff.num_planes,)
+            dtype = si_tiff.dtype.newbyteorder("=")
+
+            # write one frame at a time, read from the memory-mapped views
+            chn_frames = (
+                np.stack([pln_movie[frame_idx] for pln_movie in pln_movies], axis=-1)
+                if si_tiff.num_planes > 1
+                else pln_movies[0][frame_idx]
+                for frame_idx in range(num_frames)
+            )
             save_fp = output_dir / "{}_chn{}.tif".format(fname, chn_idx)
-            imsave(save_fp.as_posix(), chn_vol)
+            with TiffWriter(
+                save_fp.as_posix(),
+                bigtiff=np.prod(chn_shape) * dtype.itemsize > 2**32 - 2**25,
+            ) as tiff_writer:
+                tiff_writer.write(
+                    (frame.astype(dtype, copy=False) for frame in chn_frames),
+                    shape=chn_shape,
+                    dtype=dtype,
+                )
 
 
 def _save_mc(
@@ -1,61 +1,342 @@
+import json
 import os
 import h5py
 from datetime import datetime
 from pathlib import Path
 
 import numpy as np
+from scipy import sparse
 from scipy.io import loadmat
+from scipy.io.matlab import matfile_version
 
 
 class EXTRACT_loader:
-    def __init__(self, extract_file_path: str):
+    def __init__(
+        self,
+        extract_file_path: str,
+        mask_block_size: int = 32,
+        cache_spatial_weights: bool = False,
+        cache_temporal_weights: bool = False,
+    ):
         """Initialize EXTRACT loader class
 
+        The MAT-file version is read from the file header and no results are loaded
+        until they are accessed.
+
+        Spatial weights are loaded as a sparse (MaskId, Height * Width) matrix.
+        For v7.3 (HDF5) files, the masks are streamed from the file in blocks of
+        `mask_block_size` masks, so the dense (MaskId, Height, Width) array is never
+        held in memory. If `cache_spatial_weights` is True, the sparse matrix is saved
+        next to the EXTRACT output file (`<file stem>_spatial_weights.npz`) and reused
+        by later loads, as long as the EXTRACT output file is unchanged.
+
+        Temporal weights are exposed as a (MaskId, Time) array-like, `temporal_weights`.
+        For v7.3 files, indexing it (e.g. `temporal_weights[[3, 7], 1000:2000]`) reads
+        only the requested masks and time window from the file. For v5 files, if
+        `cache_temporal_weights` is True, the temporal weights are saved next to the
+        EXTRACT output file (`<file stem>_temporal_weights.npy`) and memory-mapped.
+
         Args:
             extract_file_path (str): string, absolute file path to EXTRACT output file.
+            mask_block_size (int): number of masks read from the file at a time.
+            cache_spatial_weights (bool): save the sparse spatial weights to a sidecar file.
+            cache_temporal_weights (bool): save the temporal weights of v5 files to a
+                sidecar file.
         """
+        self.extract_file_path = Path(extract_file_path)
+        self.mask_block_size = mask_block_size
+        self.cache_spatial_weights = cache_spatial_weights
+        self.cache_temporal_weights = cache_temporal_weights
+        self._results = None
+        self._spatial_shape = None
+        self._spatial_weights = None
+        self._sparse_spatial_weights = None
+        self._temporal_weights = None
 
         self.creation_time = datetime.fromtimestamp(os.stat(extract_file_path).st_ctime)
-        try:
-            results = loadmat(extract_file_path)
 
-            self.S = results["output"][0]["spatial_weights"][
-                0
-            ]  # (Height, Width, MaskId)
-            self.spatial_weights = self.S.transpose([2, 0, 1])  # MaskId, Height, Width
-            self.T = results["output"][0]["temporal_weights"][0]  # (Time, MaskId)
+        mat_version, _ = matfile_version(extract_file_path)
+        self.is_hdf5 = mat_version == 2
+        if self.is_hdf5:
+            with h5py.File(extract_file_path, "r") as results:
+                self._spatial_shape = results["output"]["spatial_weights"].shape[
+                    1:
+                ]  # (MaskId, Height, Width)
+            self._temporal_weights = _HDF5ArrayView(
+                self.extract_file_path, "output/temporal_weights"
+            )  # (MaskId, Time)
+
+    def _load_mat(self):
+        """Load the results of a v5 MAT-file"""
+        if self._results is None:
+            results = loadmat(self.extract_file_path)
+            self._results = dict(
+                S=results["output"][0]["spatial_weights"][0],  # (Height, Width, MaskId)
+                T=results["output"][0]["temporal_weights"][0],  # (Time, MaskId)
+            )
+            self._spatial_shape = self._results["S"].shape[:2]
+        return self._results
+
+    @property
+    def S(self) -> np.ndarray:
+        """Spatial weights as a dense (Height, Width, MaskId) array"""
+        if self.is_hdf5 or self._results is None:
+            return self.spatial_weights.transpose([1, 2, 0])
+        return self._results["S"]
+
+    @property
+    def T(self) -> np.ndarray:
+        """Temporal weights, (Time, MaskId) for v5 and (MaskId, Time) for v7.3 files"""
+        if self.is_hdf5:
+            return self.temporal_weights[:]
+        return np.asarray(self.temporal_weights).T
+
+    @property
+    def spatial_shape(self) -> tuple:
+        """(Height, Width) of the field of view"""
+        if self._spatial_shape is None:
+            self.sparse_spatial_weights  # v5 - from the cache file or the MAT-file
+        return self._spatial_shape
+
+    @property
+    def spatial_weights_cache_file(self) -> Path:
+        return self.extract_file_path.with_name(
+            f"{self.extract_file_path.stem}_spatial_weights.npz"
+        )
+
+    @property
+    def temporal_weights_cache_file(self) -> Path:
+        return self.extract_file_path.with_name(
+            f"{self.extract_file_path.stem}_temporal_weights.npy"
+        )
 
-        except NotImplementedError:
+    @property
+    def sparse_spatial_weights(self) -> sparse.csr_matrix:
+        """Spatial weights as a sparse (MaskId, Height * Width) matrix"""
+        if self._sparse_spatial_weights is None:
+            self._sparse_spatial_weights = self._load_spatial_weights_cache()
+        if self._sparse_spatial_weights is None:
+            if self.is_hdf5:
+                self._sparse_spatial_weights = self._stream_spatial_weights()
+            else:
+                S = self._load_mat()["S"]
+                self._sparse_spatial_weights = sparse.csr_matrix(
+                    S.transpose([2, 0, 1]).reshape(S.shape[2], -1)
+                )
+            if self.cache_spatial_weights:
+                self._save_spatial_weights_cache()
+        return self._sparse_spatial_weights
+
+    @property
+    def spatial_weights(self) -> np.ndarray:
+        """Spatial weights as a dense (MaskId, Height, Width) array"""
+        if self._spatial_weights is None:
+            self._spatial_weights = self.sparse_spatial_weights.toarray().reshape(
+                -1, *self.spatial_shape
+            )
+        return self._spatial_weights
+
+    @property
+    def temporal_weights(self):
+        """Temporal weights as a (MaskId, Time) array-like
+
+        v7.3 files: read from the file on indexing.
+        v5 files: memory-mapped from the cache file if `cache_temporal_weights`,
+            otherwise loaded from the MAT-file.
+        """
+        if self._temporal_weights is None:
+            cache_file = self.temporal_weights_cache_file
+            if self._is_cache_valid(cache_file.with_suffix(".json")):
+                self._temporal_weights = np.load(cache_file, mmap_mode="r")
+            elif self.cache_temporal_weights:
+                np.save(
+                    cache_file, np.ascontiguousarray(self._load_mat()["T"].T)
+                )  # (MaskId, Time)
+                self._save_cache_meta(cache_file.with_suffix(".json"))
+                self._temporal_weights = np.load(cache_file, mmap_mode="r")
+            else:
+                self._temporal_weights = self._load_mat()["T"].T
+        return self._temporal_weights
+
+    def _stream_spatial_weights(self) -> sparse.csr_matrix:
+        """Read the spatial weights from the HDF5 file, one block of masks at a time"""
+        with h5py.File(self.extract_file_path, "r") as results:
+            spatial_weights = results["output"]["spatial_weights"]
+            mask_count = spatial_weights.shape[0]
+            blocks = [
+                sparse.csr_matrix(
+                    spatial_weights[start : start + self.mask_block_size].reshape(
+                        -1, np.prod(self.spatial_shape)
+                    )
+                )
+                for start in range(0, mask_count, self.mask_block_size)
+            ]
+        if not blocks:
+            return sparse.csr_matrix((0, np.prod(self.spatial_shape)))
+        return sparse.vstack(blocks, format="csr")
 
-            results = h5py.File(extract_file_path, "r")
-            self.spatial_weights = results["output"]["spatial_weights"][
-                :
-            ]  # (MaskId, Height, Width)
-            self.T = results["output"]["temporal_weights"][:]  # (MaskId, Time)
+    def _is_cache_valid(self, cache_meta_file: Path) -> bool:
+        """Whether a cache file was created from the current EXTRACT output file"""
+        if not cache_meta_file.exists():
+            return False
+        file_stat = self.extract_file_path.stat()
+        with open(cache_meta_file, "r") as f:
+            meta = json.load(f)
+        return (
+            meta["source_size"] == file_stat.st_size
+            and meta["source_mtime"] == file_stat.st_mtime
+        )
+
+    def _save_cache_meta(self, cache_meta_file: Path):
+        file_stat = self.extract_file_path.stat()
+        with open(cache_meta_file, "w") as f:
+            json.dump(
+                dict(source_size=file_stat.st_size, source_mtime=file_stat.st_mtime), f
+            )
 
-    def load_results(self):
+    def _load_spatial_weights_cache(self):
+        """Return the cached sparse spatial weights, None if missing or outdated"""
+        cache_file = self.spatial_weights_cache_file
+        if not (
+            cache_file.exists()
+            and self._is_cache_valid(cache_file.with_suffix(".json"))
+        ):
+            return None
+        with np.load(cache_file) as cache:
+            self._spatial_shape = tuple(int(d) for d in cache["spatial_shape"])
+            return sparse.csr_matrix(
+                (cache["data"], cache["indices"], cache["indptr"]),
+                shape=tuple(cache["shape"]),
+            )
+
+    def _save_spatial_weights_cache(self):
+        cache_file = self.spatial_weights_cache_file
+        np.savez(
+            cache_file,
+            data=self._sparse_spatial_weights.data,
+            indices=self._sparse_spatial_weights.indices,
+            indptr=self._sparse_spatial_weights.indptr,
+            shape=self._sparse_spatial_weights.shape,
+            spatial_shape=self.spatial_shape,
+        )
+        self._save_cache_meta(cache_file.with_suffix(".json"))
+
+    def load_results(self, columnar: bool = False):
         """Load the EXTRACT results
 
+        The pixels, weights and weighted centers of all masks are computed at once
+        from the sparse spatial weights.
+
+        Args:
+            columnar (bool): if True, return the masks as a columnar table instead of
+                a list of dictionaries.
+
         Returns:
-            masks (dict): Details of the masks identified with the EXTRACT segmentation package.
+            masks (list): Details of the masks identified with the EXTRACT segmentation
+                package, one dictionary per mask. The center of a mask without any
+                pixel is None.
+            masks (dict): If `columnar` is True, one array per field, with one entry
+                per mask for `mask_id`, `mask_npix`, `mask_center_x` and
+                `mask_center_y` (-1 for masks without any pixel). `mask_xpix`,
+                `mask_ypix` and `mask_weights` are the concatenated pixels of all
+                masks; the pixels of mask `i` are at
+                `mask_pixel_offsets[i]:mask_pixel_offsets[i + 1]`.
         """
-        from scipy.sparse import find
+        spatial_weights = self.sparse_spatial_weights
+        spatial_weights.sort_indices()
+        mask_count = spatial_weights.shape[0]
+
+        mask_pixel_offsets = spatial_weights.indptr
+        mask_npix = np.diff(mask_pixel_offsets)
+        ypixels, xpixels = np.divmod(spatial_weights.indices, self.spatial_shape[1])
+        weights = spatial_weights.data
+
+        # weighted centers, as segment sums over the pixels of each mask
+        pixel_mask_ids = np.repeat(np.arange(mask_count), mask_npix)
+        weight_sums = np.bincount(pixel_mask_ids, weights=weights, minlength=mask_count)
+        has_pixels = weight_sums != 0
+        mask_centers = {}
+        for axis, pixels in (("x", xpixels), ("y", ypixels)):
+            weighted_sums = np.bincount(
+                pixel_mask_ids, weights=weights * pixels, minlength=mask_count
+            )
+            centers = np.full(mask_count, -1, dtype=int)
+            centers[has_pixels] = (
+                weighted_sums[has_pixels] / weight_sums[has_pixels] + 0.5
+            ).astype(int)
+            mask_centers[axis] = centers
+
+        if columnar:
+            return dict(
+                mask_id=np.arange(mask_count),
+                mask_npix=mask_npix,
+                mask_center_x=mask_centers["x"],
+                mask_center_y=mask_centers["y"],
+                mask_pixel_offsets=mask_pixel_offsets,
+                mask_xpix=xpixels,
+                mask_ypix=ypixels,
+                mask_weights=weights,
+            )
 
         masks = []
 
-        for mask_id, s in enumerate(self.spatial_weights):
-            ypixels, xpixels, weights = find(s)
+        for mask_id, (start, end) in enumerate(
+            zip(mask_pixel_offsets[:-1], mask_pixel_offsets[1:])
+        ):
             masks.append(
                 dict(
                     mask_id=mask_id,
-                    mask_npix=len(weights),
-                    mask_weights=weights,
-                    mask_center_x=int(np.average(xpixels, weights=weights) + 0.5),
-                    mask_center_y=int(np.average(ypixels, weights=weights) + 0.5),
+                    mask_npix=int(end - start),
+                    mask_weights=weights[start:end],
+                    mask_center_x=(
+                        int(mask_centers["x"][mask_id]) if has_pixels[mask_id] else None
+                    ),
+                    mask_center_y=(
+                        int(mask_centers["y"][mask_id]) if has_pixels[mask_id] else None
+                    ),
                     mask_center_z=None,
-                    mask_xpix=xpixels,
-                    mask_ypix=ypixels,
+                    mask_xpix=xpixels[start:end],
+                    mask_ypix=ypixels[start:end],
                     mask_zpix=None,
                 )
             )
         return masks
+
+
+class _HDF5ArrayView:
+    """Read-only, numpy-like view of an HDF5 dataset, read from the file on indexing
+
+    The first axis may be indexed with a list of (unsorted, repeated, negative)
+    indices, which h5py does not support natively.
+    """
+
+    def __init__(self, file_path: Path, dataset_name: str):
+        self.file_path = Path(file_path)
+        self.dataset_name = dataset_name
+        with h5py.File(self.file_path, "r") as h5f:
+            self.shape = h5f[dataset_name].shape
+            self.dtype = h5f[dataset_name].dtype
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[()], dtype=dtype)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        with h5py.File(self.file_path, "r") as h5f:
+            dataset = h5f[self.dataset_name]
+            if key and isinstance(key[0], (list, np.ndarray)):
+                indices = np.asarray(key[0])
+                if not indices.size:
+                    indices = indices.astype(int)
+                # non-negative indices, raising IndexError if out of bounds
+                indices = np.arange(self.shape[0])[indices]
+                unique_indices, inverse = np.unique(indices, return_inverse=True)
+                return dataset[(unique_indices,) + key[1:]][inverse]
+            return dataset[key]
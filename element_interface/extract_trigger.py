@@ -1,7 +1,20 @@
-import os
+import atexit
+import queue
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
 from textwrap import dedent
-from typing import Union
+from typing import Callable, Union
+
+import h5py
+import numpy as np
+import tifffile
+from scipy.io import whosmat
+
+from .extract_loader import EXTRACT_loader
 
 
 class EXTRACT_trigger:
@@ -18,9 +31,7 @@ class EXTRACT_trigger:
             warning('EXTRACT_public directory not found or invalid. Path: %s', extractDir);
         end
        
-        % Load Data
-        data = load('{scanfile}');
-        M = data.M;
+        {load_data_string}
        
         % Input Parameters
         config = struct();
@@ -42,7 +53,10 @@ class EXTRACT_trigger:
     ) -> None:
         """A helper class to trigger EXTRACT analysis in element-calcium-imaging.
         Args:
-            scanfile (Union[str, Path]): Full path of the scan
+            scanfile (Union[str, Path]): Full path of the scan, a .mat file containing
+                the movie `M` (Height x Width x Time). v7.3 files (e.g. written with
+                `tiff_to_extract_mat`) are read by EXTRACT in partitions, other .mat
+                files are loaded in full.
             parameters (dict): EXTRACT input paramaters.
             output_dir (Union[str, Path]): Directory to store the outputs of EXTRACT analysis.
             extract_dir (Union[str, Path]): Path to EXTRACT-public directory.
@@ -60,7 +74,76 @@ class EXTRACT_trigger:
         self.output_fullpath = (
             self.output_dir / f"{self.scanfile.stem}_extract_output.mat"
         )
-        m_file_content = self.m_template.format(
+        m_file_content = self._compose_script(
+            load_data_string=(
+                "% Movie in HDF5 (v7.3) file, read by EXTRACT in partitions\n"
+                f"M = '{self.scanfile.as_posix()}:/M';"
+                if h5py.is_hdf5(self.scanfile)
+                else "% Load Data\n"
+                f"data = load('{self.scanfile.as_posix()}');\n"
+                f"M = data.M;"
+            ),
+            output_fullpath=self.output_fullpath,
+        )
+        self.m_file_fp = self.output_dir / "dj_run_extract.m"
+        with open(self.m_file_fp, "w") as f:
+            f.write(m_file_content)
+
+    def write_partition_run_scripts(
+        self, partitions: tuple = (2, 2), overlap: int = 20
+    ):
+        """Compose one dj_run_extract.m script per spatial partition of the FOV.
+
+        The FOV is split into a grid of `partitions` (rows, columns) partitions,
+        each extended by `overlap` pixels on each side. The script of partition `i`,
+        in the `partition_{i}` subfolder of `output_dir`, reads only its part of
+        the movie (with `matfile`) and saves the EXTRACT output in the same folder.
+
+        Args:
+            partitions (tuple): number of partitions along (Height, Width)
+            overlap (int): number of pixels shared by neighboring partitions
+
+        Returns:
+            partitions (list): one dictionary per partition with the `window` and the
+                `core` (non-overlapping part) of the partition, as
+                ((row_start, row_stop), (column_start, column_stop)), the `m_file_fp`
+                and the `output_fullpath`.
+        """
+        height, width = _get_movie_shape(self.scanfile)[:2]
+        row_bounds = np.linspace(0, height, partitions[0] + 1).astype(int)
+        col_bounds = np.linspace(0, width, partitions[1] + 1).astype(int)
+
+        self.partitions = []
+        for row_start, row_stop in zip(row_bounds[:-1], row_bounds[1:]):
+            for col_start, col_stop in zip(col_bounds[:-1], col_bounds[1:]):
+                rows = (max(row_start - overlap, 0), min(row_stop + overlap, height))
+                cols = (max(col_start - overlap, 0), min(col_stop + overlap, width))
+                partition_dir = self.output_dir / f"partition_{len(self.partitions)}"
+                partition_dir.mkdir(parents=True, exist_ok=True)
+                partition = dict(
+                    window=(rows, cols),
+                    core=((row_start, row_stop), (col_start, col_stop)),
+                    m_file_fp=partition_dir / "dj_run_extract.m",
+                    output_fullpath=partition_dir
+                    / f"{self.scanfile.stem}_extract_output.mat",
+                )
+                m_file_content = self._compose_script(
+                    load_data_string=(
+                        f"% Load partition (rows {rows[0] + 1}-{rows[1]},"
+                        f" columns {cols[0] + 1}-{cols[1]}) of the movie\n"
+                        f"scan = matfile('{self.scanfile.as_posix()}');\n"
+                        f"M = scan.M({rows[0] + 1}:{rows[1]}, {cols[0] + 1}:{cols[1]}, :);"
+                    ),
+                    output_fullpath=partition["output_fullpath"],
+                )
+                with open(partition["m_file_fp"], "w") as f:
+                    f.write(m_file_content)
+                self.partitions.append(partition)
+
+        return self.partitions
+
+    def _compose_script(self, load_data_string: str, output_fullpath: Path) -> str:
+        return self.m_template.format(
             **dict(
                 parameters_list_string="\n".join(
                     [
@@ -76,28 +159,365 @@ class EXTRACT_trigger:
                         for k, v in self.parameters.items()
                     ]
                 ),
-                scanfile=self.scanfile.as_posix(),
-                output_fullpath=self.output_fullpath.as_posix(),
+                load_data_string=load_data_string,
+                output_fullpath=output_fullpath.as_posix(),
                 extract_dir=self.extract_dir.as_posix(),
             )
         ).lstrip()
-        self.m_file_fp = self.output_dir / "dj_run_extract.m"
-        with open(self.m_file_fp, "w") as f:
-            f.write(m_file_content)
 
-    def run(self):
-        """Run the matlab dj_run_extract.m script."""
+    def run(self, pool: "MatlabEnginePool" = None):
+        """Run the matlab dj_run_extract.m script.
+
+        Args:
+            pool (MatlabEnginePool): pool of MATLAB engines to run the script with.
+                Defaults to a pool of one engine shared by all EXTRACT_trigger runs in
+                this process.
+        """
         # Generate and write the script
         self.write_matlab_run_script()
 
-        current_dir = Path.cwd()
-        os.chdir(self.output_dir)
-        try:
-            import matlab.engine
+        pool = pool or _default_engine_pool()
+        pool.run_script(self.m_file_fp)
+
+    def run_partitioned(
+        self,
+        partitions: tuple = (2, 2),
+        overlap: int = 20,
+        pool: "MatlabEnginePool" = None,
+    ):
+        """Run EXTRACT on spatial partitions of the FOV in parallel, and merge outputs.
 
-            eng = matlab.engine.start_matlab()
-            eng.dj_run_extract(nargout=0)
-        except Exception as e:
-            raise e
+        See `write_partition_run_scripts`. Cells found in several partitions (in the
+        overlap zones) are kept only from the partition whose core contains the
+        weighted center of the cell. The merged output is saved at the same path as
+        the output of `run` and can be loaded with `EXTRACT_loader`.
+
+        Args:
+            partitions (tuple): number of partitions along (Height, Width)
+            overlap (int): number of pixels shared by neighboring partitions. Should be
+                larger than the cell diameter.
+            pool (MatlabEnginePool): pool of MATLAB engines to run the scripts with.
+                Defaults to a new pool of one engine per partition.
+        """
+        self.write_partition_run_scripts(partitions=partitions, overlap=overlap)
+
+        own_pool = pool is None
+        pool = pool or MatlabEnginePool(max_engines=len(self.partitions))
+        try:
+            futures = [
+                pool.submit_script(partition["m_file_fp"])
+                for partition in self.partitions
+            ]
+            [future.result() for future in futures]
         finally:
-            os.chdir(current_dir)
+            if own_pool:
+                pool.close()
+
+        self.output_fullpath = (
+            self.output_dir / f"{self.scanfile.stem}_extract_output.mat"
+        )
+        _merge_partition_outputs(
+            self.partitions, _get_movie_shape(self.scanfile), self.output_fullpath
+        )
+
+
+def _get_movie_shape(scanfile: Path) -> tuple:
+    """(Height, Width, Time) of the movie `M` in a .mat file, without loading it"""
+    if h5py.is_hdf5(scanfile):
+        with h5py.File(scanfile, "r") as h5f:
+            return h5f["M"].shape[::-1]  # stored as (Time, Width, Height)
+    return next(shape for name, shape, _ in whosmat(scanfile) if name == "M")
+
+
+def _merge_partition_outputs(partitions: list, movie_shape: tuple, merged_path: Path):
+    """Merge the EXTRACT outputs of the FOV partitions into one v7.3 output file.
+
+    EXTRACT saves its output with `-v7.3`, so spatial weights are read by
+    `EXTRACT_loader` in the HDF5 (column-major) layout: (MaskId, Width, Height).
+    The merged file follows the same layout.
+    """
+    height, width, n_frames = movie_shape
+    # ids of the masks kept from each partition, before writing any of them
+    kept_masks = []
+    for partition in partitions:
+        (row_start, row_stop), (col_start, col_stop) = partition["window"]
+        (core_rows, core_cols) = partition["core"]
+        extract_loader = EXTRACT_loader(partition["output_fullpath"])
+        masks = extract_loader.load_results(columnar=True)
+        # loader "y" (1st axis) is the movie column, loader "x" (2nd axis) the row
+        center_rows = masks["mask_center_x"] + row_start
+        center_cols = masks["mask_center_y"] + col_start
+        is_in_core = (
+            (masks["mask_npix"] > 0)
+            & (center_rows >= core_rows[0])
+            & (center_rows < core_rows[1])
+            & (center_cols >= core_cols[0])
+            & (center_cols < core_cols[1])
+        )
+        kept_masks.append((partition, extract_loader, np.flatnonzero(is_in_core)))
+    n_masks = sum(len(mask_ids) for _, _, mask_ids in kept_masks)
+
+    with h5py.File(merged_path, "w", userblock_size=512) as h5f:
+        output = h5f.create_group("output")
+        output.attrs["MATLAB_class"] = np.bytes_("struct")
+        output_spatial_weights = output.create_dataset(
+            "spatial_weights",
+            shape=(n_masks, width, height),
+            dtype=np.float64,
+            chunks=(1, width, height) if n_masks else None,
+            compression="gzip" if n_masks else None,
+        )
+        output_temporal_weights = output.create_dataset(
+            "temporal_weights", shape=(n_masks, n_frames), dtype=np.float64
+        )
+        # write the window of each mask, the rest of the FOV is left at zero
+        output_mask_id = 0
+        for partition, extract_loader, mask_ids in kept_masks:
+            (row_start, row_stop), (col_start, col_stop) = partition["window"]
+            partition_spatial_weights = extract_loader.sparse_spatial_weights
+            for mask_id in mask_ids:
+                output_spatial_weights[
+                    output_mask_id, col_start:col_stop, row_start:row_stop
+                ] = (
+                    partition_spatial_weights[mask_id]
+                    .toarray()
+                    .reshape(extract_loader.spatial_shape)
+                )
+                output_temporal_weights[
+                    output_mask_id
+                ] = extract_loader.temporal_weights[mask_id]
+                output_mask_id += 1
+        for name in ("spatial_weights", "temporal_weights"):
+            output[name].attrs["MATLAB_class"] = np.bytes_("double")
+
+    _write_mat73_header(merged_path)
+
+
+def tiff_to_extract_mat(
+    tiff_paths: Union[str, Path, list],
+    mat_path: Union[str, Path],
+    chunk_shape: tuple = (64, 128, 128),
+) -> Path:
+    """Stream TIFF/BigTIFF frames into a v7.3 .mat file usable as EXTRACT input.
+
+    Frames are read page by page and written in blocks of `chunk_shape[0]` frames,
+    so the movie is never held in memory. The movie is saved as `M`, a chunked HDF5
+    dataset seen as (Height x Width x Time) by MATLAB.
+
+    Example:
+        > tiff_fp = PrairieViewMeta(pv_dir).write_single_bigtiff(output_dir=out_dir)
+
+        > mat_fp = tiff_to_extract_mat(tiff_fp, out_dir / "scan.mat")
+
+        > EXTRACT_trigger(mat_fp, parameters, out_dir, extract_dir).run()
+
+    Args:
+        tiff_paths (Union[str, Path, list]): TIFF file(s), concatenated in order
+        mat_path (Union[str, Path]): output .mat file
+        chunk_shape (tuple): HDF5 chunk shape as (Time, Height, Width), clipped to
+            the movie dimensions.
+
+    Returns:
+        mat_path (Path): the output .mat file
+    """
+    if isinstance(tiff_paths, (str, Path)):
+        tiff_paths = [tiff_paths]
+    mat_path = Path(mat_path)
+
+    chunk_frames = chunk_shape[0]
+    frames = []
+    frame_count = 0
+    # MATLAB v7.3 files are HDF5 files with a 512-byte MATLAB header
+    with h5py.File(mat_path, "w", userblock_size=512) as h5f:
+        movie = None
+        for tiff_path in tiff_paths:
+            with tifffile.TiffFile(Path(tiff_path).as_posix()) as tffl:
+                for page in tffl.pages:
+                    frames.append(page.asarray())
+                    if len(frames) < chunk_frames:
+                        continue
+                    if movie is None:
+                        movie = _create_mat73_movie(h5f, frames[0], chunk_shape)
+                    _append_frames(movie, frames, frame_count)
+                    frame_count += len(frames)
+                    frames = []
+        if frames:
+            if movie is None:
+                movie = _create_mat73_movie(h5f, frames[0], chunk_shape)
+            _append_frames(movie, frames, frame_count)
+            frame_count += len(frames)
+
+    _write_mat73_header(mat_path)
+
+    return mat_path
+
+
+def _create_mat73_movie(h5f: h5py.File, frame: np.ndarray, chunk_shape: tuple):
+    """Create the resizable (Time, Width, Height) dataset `M` of a v7.3 .mat file"""
+    height, width = frame.shape
+    movie = h5f.create_dataset(
+        "M",
+        shape=(0, width, height),
+        maxshape=(None, width, height),
+        dtype=frame.dtype,
+        chunks=(
+            chunk_shape[0],
+            min(chunk_shape[2], width),
+            min(chunk_shape[1], height),
+        ),
+    )
+    movie.attrs["MATLAB_class"] = np.bytes_(
+        {"float32": "single", "float64": "double"}.get(
+            frame.dtype.name, frame.dtype.name
+        )
+    )
+    return movie
+
+
+def _append_frames(movie: h5py.Dataset, frames: list, start: int):
+    movie.resize(start + len(frames), axis=0)
+    # MATLAB is column-major, a (Height, Width) frame is stored as (Width, Height)
+    movie[start : start + len(frames)] = np.stack(frames).transpose([0, 2, 1])
+
+
+def _write_mat73_header(mat_path: Path):
+    header = (
+        f"MATLAB 7.3 MAT-file, Platform: GLNXA64, "
+        f"Created on: {datetime.now():%a %b %d %H:%M:%S %Y} HDF5 schema 1.00 ."
+    ).encode()
+    # 116 bytes of text, 8 bytes of subsystem offset, version 0x0200, endian "IM"
+    header = header.ljust(116) + b" " * 8 + b"\x00\x02" + b"IM"
+    with open(mat_path, "r+b") as f:
+        f.write(header.ljust(512, b"\x00"))
+
+
+class MatlabEnginePool:
+    """A bounded pool of MATLAB engines, reused across EXTRACT_trigger runs.
+
+    Starting a MATLAB engine takes tens of seconds, so engines are started on demand,
+    up to `max_engines`, and kept alive for the next run. Scripts are run by their
+    absolute path with MATLAB's `run`, which changes the working directory of the
+    MATLAB session only, so concurrent runs do not interfere.
+
+    Example:
+        > with MatlabEnginePool(max_engines=2) as pool:
+              futures = [pool.submit(EXTRACT_trigger(...)) for ... in sessions]
+              [f.result() for f in futures]
+
+    Args:
+        max_engines (int): maximum number of engines running at the same time
+        engine_factory (Callable): function returning a new engine, any object with
+            `run(script_path, nargout=0)` and `quit()` methods. Defaults to
+            `matlab.engine.start_matlab`. Use `MatlabBatchEngine` to run each script
+            in a `matlab -batch` subprocess instead.
+    """
+
+    def __init__(self, max_engines: int = 1, engine_factory: Callable = None):
+        self.max_engines = max_engines
+        self.engine_factory = engine_factory or _start_matlab_engine
+        self._idle_engines = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_engines)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def engine(self):
+        """Borrow an engine from the pool, starting one if none is idle.
+
+        An engine that raised an error is shut down instead of being returned.
+        """
+        with self._slots:
+            try:
+                eng = self._idle_engines.get_nowait()
+            except queue.Empty:
+                eng = self.engine_factory()
+            try:
+                yield eng
+            except Exception:
+                _quit_engine(eng)
+                raise
+            else:
+                self._idle_engines.put(eng)
+
+    def run_script(self, script_path: Union[str, Path]):
+        """Run a MATLAB script (or function without arguments) by its absolute path."""
+        with self.engine() as eng:
+            eng.run(Path(script_path).absolute().as_posix(), nargout=0)
+
+    def submit(self, trigger: "EXTRACT_trigger") -> Future:
+        """Queue an EXTRACT_trigger run, executed once an engine is available."""
+        return self._get_executor().submit(trigger.run, pool=self)
+
+    def submit_script(self, script_path: Union[str, Path]) -> Future:
+        """Queue a MATLAB script run, executed once an engine is available."""
+        return self._get_executor().submit(self.run_script, script_path)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_engines)
+            return self._executor
+
+    def close(self):
+        """Wait for the queued runs and shut down all engines."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        while True:
+            try:
+                _quit_engine(self._idle_engines.get_nowait())
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MatlabBatchEngine:
+    """Engine stand-in running each script in a new `matlab -batch` subprocess.
+
+    Args:
+        matlab_executable (str): path to the `matlab` executable
+    """
+
+    def __init__(self, matlab_executable: str = "matlab"):
+        self.matlab_executable = matlab_executable
+
+    def run(self, script_path: str, nargout: int = 0):
+        subprocess.run(
+            [self.matlab_executable, "-batch", f"run('{script_path}')"], check=True
+        )
+
+    def quit(self):
+        pass
+
+
+def _start_matlab_engine():
+    import matlab.engine
+
+    return matlab.engine.start_matlab()
+
+
+def _quit_engine(eng):
+    try:
+        eng.quit()
+    except Exception:
+        pass  # engine already terminated
+
+
+_engine_pool = None
+_engine_pool_lock = threading.Lock()
+
+
+def _default_engine_pool() -> MatlabEnginePool:
+    """The pool of one engine shared by all EXTRACT_trigger runs in this process"""
+    global _engine_pool
+    with _engine_pool_lock:
+        if _engine_pool is None:
+            _engine_pool = MatlabEnginePool(max_engines=1)
+            atexit.register(_engine_pool.close)
+    return _engine_pool
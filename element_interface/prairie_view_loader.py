@@ -1,8 +1,15 @@
+import collections
+import itertools
+import math
 import os
 import pathlib
+import queue
+import threading
 from pathlib import Path
 import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+import h5py
 import numpy as np
 import tifffile
 import logging
@@ -11,22 +18,43 @@ logger = logging.getLogger(__name__)
 
 
 class PrairieViewMeta:
-    def __init__(self, prairieview_dir: str):
+    def __init__(
+        self,
+        prairieview_dir: str,
+        cache_frame_index: bool = True,
+        cache_page_index: bool = True,
+    ):
         """Initialize PrairieViewMeta loader class
 
+        The metadata and the frame index table (see `frame_index`) are parsed from
+        the .xml file once, and cached next to it (`.<xml stem>_frame_index.npz`)
+        if `cache_frame_index` is True. The cache is used as long as the
+        modification time and size of the .xml file are unchanged.
+
+        Likewise, the byte offset of the pages of a multi-page tiff file (see
+        `page_index`) is indexed when the file is first read, and cached in
+        `.<xml stem>_page_index.npz` if `cache_page_index` is True. The cached
+        offsets of a file are used as long as its modification time and size are
+        unchanged, so later reads of its uncompressed pages skip the tiff parsing.
+
         Args:
             prairieview_dir (str): string, absolute file path to directory containing PrairieView dataset
+            cache_frame_index (bool): read/write the cached metadata and frame index
+            cache_page_index (bool): read/write the cached page index
         """
-        # ---- Search and verify CaImAn output file exists ----
+        # ---- Search and verify PrairieView metadata file exists ----
         # May return multiple xml files. Only need one that contains scan metadata.
         self.prairieview_dir = Path(prairieview_dir)
 
         for file in self.prairieview_dir.glob("*.xml"):
-            xml_tree = ET.parse(file.as_posix())
-            xml_root = xml_tree.getroot()
-            if xml_root.find(".//Sequence"):
+            parsed_xml = _load_frame_index_cache(file) if cache_frame_index else None
+            if parsed_xml is None:
+                parsed_xml = _parse_prairieview_xml(file)
+                if parsed_xml is not None and cache_frame_index:
+                    _save_frame_index_cache(file, *parsed_xml)
+            if parsed_xml is not None:
                 self.xml_file = file
-                self._xml_root = xml_root
+                self._metainfo, self.frame_index, self.filenames = parsed_xml
                 break
         else:
             raise FileNotFoundError(
@@ -34,11 +62,18 @@ class PrairieViewMeta:
             )
 
         self._meta = None
+        self._frame_times = None
+        self.cache_page_index = cache_page_index
+        self._page_index = {}  # file_id: page index rows of the file
+        self._page_index_stats = {}  # file_id: (size, mtime) of the file
+        self._page_index_cache = None  # (page_index, file_stats) of the cache file
+        self._page_index_dirty = False
+        self._page_index_lock = threading.Lock()
 
     @property
     def meta(self):
         if self._meta is None:
-            self._meta = _extract_prairieview_metadata(self.xml_file)
+            self._meta = dict(self._metainfo)
             # adjust for the different definition of "frames"
             # from the ome meta - "frame" refers to an image at a given scanning depth, time step combination
             # in the imaging pipeline - "frame" refers to video frames - i.e. time steps
@@ -48,6 +83,188 @@ class PrairieViewMeta:
 
         return self._meta
 
+    @property
+    def relative_times(self) -> np.ndarray:
+        """(frame x plane) array of the Frame "relativeTime" (s), NaN if missing
+
+        Frames are time steps (volumes for multi-plane scans) and planes are in
+        the order of `meta["plane_indices"]`.
+        """
+        return self._get_frame_times()["relative_time"]
+
+    @property
+    def absolute_times(self) -> np.ndarray:
+        """(frame x plane) array of the Frame "absoluteTime" (s), NaN if missing"""
+        return self._get_frame_times()["absolute_time"]
+
+    def get_frame_timing_stats(self, drop_tolerance: float = 0.5) -> dict:
+        """Frame period, jitter and dropped frames of each plane
+
+        Computed from the intervals between the `relative_times` of consecutive
+        frames of each plane. An interval longer than the median interval by more
+        than `drop_tolerance` periods is counted as round(interval / median) - 1
+        dropped frames.
+
+        Args:
+            drop_tolerance (float): fraction of the frame period beyond which an
+                interval has dropped frames
+
+        Returns:
+            stats (dict): arrays with one value per plane, with keys
+                frame_period (median interval, s), jitter (standard deviation of
+                the intervals without dropped frames, s), max_jitter (largest
+                deviation of those intervals from the median, s), dropped_frames
+                (number of frames missing from the intervals) and missing_frames
+                (number of frames missing at the end of incomplete volumes)
+        """
+        intervals = np.diff(self.relative_times, axis=0)
+        n_planes = intervals.shape[1]
+        stats = dict(
+            frame_period=np.full(n_planes, np.nan),
+            jitter=np.full(n_planes, np.nan),
+            max_jitter=np.full(n_planes, np.nan),
+            dropped_frames=np.zeros(n_planes, dtype=int),
+            missing_frames=np.isnan(self.relative_times).sum(axis=0),
+        )
+        for plane_pos in range(n_planes):
+            plane_intervals = intervals[:, plane_pos]
+            plane_intervals = plane_intervals[~np.isnan(plane_intervals)]
+            if not len(plane_intervals):
+                continue
+            frame_period = np.median(plane_intervals)
+            has_drops = plane_intervals > frame_period * (1 + drop_tolerance)
+            deviations = plane_intervals[~has_drops] - frame_period
+            stats["frame_period"][plane_pos] = frame_period
+            stats["jitter"][plane_pos] = deviations.std()
+            stats["max_jitter"][plane_pos] = np.abs(deviations).max()
+            stats["dropped_frames"][plane_pos] = np.sum(
+                np.rint(plane_intervals[has_drops] / frame_period) - 1
+            )
+        return stats
+
+    def _get_frame_times(self) -> dict:
+        """Arrays of `relative_times` and `absolute_times`, from the frame index"""
+        if self._frame_times is None:
+            plane_indices = np.asarray(self.meta["plane_indices"])
+            frame_index = self.frame_index[
+                self.frame_index["channel"] == self.meta["channels"][0]
+            ]
+            # position of each frame among the frames of its plane
+            plane_sorter = np.argsort(plane_indices)
+            plane_pos = plane_sorter[
+                np.searchsorted(
+                    plane_indices, frame_index["plane"], sorter=plane_sorter
+                )
+            ]
+            order = np.argsort(plane_pos, kind="stable")
+            plane_starts = np.searchsorted(plane_pos[order], plane_pos[order])
+            frame_pos = np.empty(len(order), dtype=int)
+            frame_pos[order] = np.arange(len(order)) - plane_starts
+
+            n_frames = frame_pos.max() + 1 if len(frame_pos) else 0
+            self._frame_times = {}
+            for key in ("relative_time", "absolute_time"):
+                frame_times = np.full((n_frames, len(plane_indices)), np.nan)
+                frame_times[frame_pos, plane_pos] = frame_index[key]
+                self._frame_times[key] = frame_times
+        return self._frame_times
+
+    @property
+    def page_index(self) -> np.ndarray:
+        """Location of the image data of every page of the tiff files
+
+        A structured array with one row per page, sorted by file and page, with
+        fields: file_id (index into `filenames`), page, offset (of the image data
+        in the file, -1 if it is compressed or not stored contiguously), height,
+        width and dtype. The conversions only index the files they read, this
+        indexes all the files not yet indexed (or cached).
+        """
+        for file_id, filename in enumerate(self.filenames):
+            if self._get_file_page_index(file_id) is None:
+                try:
+                    with tifffile.TiffFile(
+                        (self.prairieview_dir / filename).as_posix()
+                    ) as tffl:
+                        self._add_file_page_index(file_id, tffl)
+                except Exception as e:
+                    logger.warning(f"Unable to index the pages of {filename}: {e}")
+        self._save_page_index()
+        page_indices = [
+            self._page_index[file_id]
+            for file_id in range(len(self.filenames))
+            if file_id in self._page_index
+        ]
+        return np.concatenate([np.empty(0, dtype=_page_index_dtype), *page_indices])
+
+    def _get_file_page_index(self, file_id: int):
+        """Page index rows of a file, from the cache if valid, None if not indexed
+
+        The file is stat'ed (to validate the cache) the first time only.
+        """
+        with self._page_index_lock:
+            if file_id in self._page_index or file_id in self._page_index_stats:
+                return self._page_index.get(file_id)
+            if self._page_index_cache is None:
+                cached = (
+                    _load_page_index_cache(self.xml_file)
+                    if self.cache_page_index
+                    else None
+                )
+                if cached is None or len(cached[1]) != len(self.filenames):
+                    cached = (
+                        np.empty(0, dtype=_page_index_dtype),
+                        np.full((len(self.filenames), 2), -1.0),
+                    )
+                self._page_index_cache = cached
+            try:
+                file_stat = (self.prairieview_dir / self.filenames[file_id]).stat()
+            except OSError:
+                return None
+            self._page_index_stats[file_id] = (file_stat.st_size, file_stat.st_mtime)
+
+            cached_page_index, cached_file_stats = self._page_index_cache
+            if tuple(cached_file_stats[file_id]) == self._page_index_stats[file_id]:
+                self._page_index[file_id] = _get_page_index_rows(
+                    cached_page_index, file_id
+                )
+            return self._page_index.get(file_id)
+
+    def _add_file_page_index(self, file_id: int, tffl: tifffile.TiffFile):
+        """Index the pages of a file open with tifffile, see `_get_file_page_index`"""
+        try:
+            page_index = _index_tiff_pages(tffl, file_id)
+        except Exception as e:  # read by tifffile only
+            logger.warning(f"Unable to index the pages of {tffl.filename}: {e}")
+            return
+        with self._page_index_lock:
+            if file_id in self._page_index_stats:
+                self._page_index[file_id] = page_index
+                self._page_index_dirty = True
+
+    def _save_page_index(self):
+        """Add the files indexed since the last save to the page index cache"""
+        with self._page_index_lock:
+            if not (self.cache_page_index and self._page_index_dirty):
+                return
+            cached_page_index, cached_file_stats = self._page_index_cache
+            file_stats = cached_file_stats.copy()
+            for file_id in self._page_index:
+                file_stats[file_id] = self._page_index_stats[file_id]
+            page_index = np.concatenate(
+                [
+                    cached_page_index[
+                        ~np.isin(cached_page_index["file_id"], list(self._page_index))
+                    ],
+                    *self._page_index.values(),
+                ]
+            )
+            page_index = page_index[
+                np.lexsort((page_index["page"], page_index["file_id"]))
+            ]
+            _save_page_index_cache(self.xml_file, page_index, file_stats)
+            self._page_index_cache = page_index, file_stats
+            self._page_index_dirty = False
+
     def get_prairieview_filenames(
         self, plane_idx=None, channel=None, return_pln_chn=False
     ):
@@ -84,17 +301,28 @@ class PrairieViewMeta:
                 channel in self.meta["channels"]
             ), f"Invalid 'channel' - Channels: {self.meta['channels']}"
 
-        # single-plane ome.tif does not have "@index" under Frame to search for
-        plane_search = f"/[@index='{plane_idx}']" if self.meta["num_planes"] > 1 else ""
-        # ome.tif does have "@channel" under File regardless of single or multi channel
-        channel_search = f"/[@channel='{channel}']"
+        frame_index = self.get_frame_index(plane_idx=plane_idx, channel=channel)
+        fnames = np.unique(self.filenames[frame_index["file_id"]]).tolist()
+        return fnames if not return_pln_chn else (fnames, plane_idx, channel)
 
-        frames = self._xml_root.findall(
-            f".//Sequence/Frame{plane_search}/File{channel_search}"
-        )
+    def get_frame_index(self, plane_idx: int, channel: int) -> np.ndarray:
+        """Rows of `frame_index` for one plane and channel, in acquisition order
 
-        fnames = np.unique([f.attrib["filename"] for f in frames]).tolist()
-        return fnames if not return_pln_chn else (fnames, plane_idx, channel)
+        `frame_index` is a structured array with one row per File entry of the
+        .xml file, with fields: cycle, frame_index, plane, channel, file_id (index
+        into `filenames`), page (0-based page in the file), relative_time and
+        absolute_time.
+
+        Args:
+            plane_idx: int - plane index
+            channel: int - channel
+
+        Returns: np.ndarray - the rows of `frame_index` for "plane_idx" and "channel"
+        """
+        is_selected = (self.frame_index["plane"] == plane_idx) & (
+            self.frame_index["channel"] == channel
+        )
+        return self.frame_index[is_selected]
 
     def write_single_bigtiff(
         self,
@@ -105,19 +333,53 @@ class PrairieViewMeta:
         caiman_compatible=False,  # if True, save the movie as a single page (frame x height x width)
         overwrite=False,
         gb_per_file=None,
+        n_workers=None,
+        compression=None,
+        predictor=None,
+        tile=None,
+        encode_workers=None,
+        spatial_bin=1,
+        temporal_bin=1,
     ):
+        """Write the frames of one plane and channel to (frame x height x width) BigTIFF
+
+        Args:
+            plane_idx: int - plane index
+            channel: int - channel
+            output_prefix: str - prefix of the output file names, defaults to the
+                common prefix of the input file names
+            output_dir: output directory
+            caiman_compatible: deprecated, no longer has any effect
+            overwrite: bool - if True, overwrite existing output files
+            gb_per_file: float - if given, split the output in files of at most this
+                many GB of image data
+            n_workers: int - number of threads reading single-page tiff files ahead
+                of the writer
+            compression: str - lossless compression of the output, e.g. "zlib" or
+                "zstd" ("zstd" needs `imagecodecs` to write and read), or a tuple of
+                (compression, level)
+            predictor: bool - if True, apply the horizontal differencing predictor
+                before compression
+            tile: tuple - (height, width) of the output tiles, multiples of 16, if
+                any, else the frames are written in strips
+            encode_workers: int - number of threads compressing each output file
+            spatial_bin: int - average the frames over blocks of `spatial_bin` x
+                `spatial_bin` pixels
+            temporal_bin: int - average every `temporal_bin` frames
+
+        Returns: the output file, or the list of output files if `gb_per_file` is given
+        """
         logger.warning(
             "Deprecation warning: `caiman_compatible` argument will no longer have any effect and will be removed in the future. `write_single_bigtiff` will return multi-page tiff, which is compatible with CaImAn."
         )
 
-        tiff_names, plane_idx, channel = self.get_prairieview_filenames(
+        _, plane_idx, channel = self.get_prairieview_filenames(
             plane_idx=plane_idx, channel=channel, return_pln_chn=True
         )
-        if output_prefix is None:
-            output_prefix = os.path.commonprefix(tiff_names)
-        output_tiff_stem = f"{output_prefix}_pln{plane_idx}_chn{channel}"
-
         output_dir = Path(output_dir)
+        output_tiff_stem = self._get_output_tiff_stem(
+            plane_idx, channel, output_prefix=output_prefix
+        )
         output_tiff_list = list(output_dir.glob(f"{output_tiff_stem}*.tif"))
         if len(output_tiff_list) and not overwrite:
             return output_tiff_list[0] if gb_per_file is None else output_tiff_list
@@ -125,229 +387,1101 @@ class PrairieViewMeta:
         # delete old tif files if overwrite is True
         [f.unlink() for f in output_tiff_list]
 
-        output_tiff_list = []
+        frame_index = self.get_frame_index(plane_idx=plane_idx, channel=channel)
+        if self.meta["is_multipage"]:
+            # For multi-page tiff - the file and page of each frame are in the frame index
+            frames = self._iter_multipage_frames(frame_index)
+        else:
+            # For single-page tiff - upcoming files are read ahead by a thread pool
+            frames = self._iter_singlepage_frames(frame_index, n_workers=n_workers)
+        output_tiff_list = self._write_bigtiff_files(
+            frames,
+            n_frames=len(frame_index),
+            output_dir=output_dir,
+            output_tiff_stem=output_tiff_stem,
+            gb_per_file=gb_per_file,
+            numbered=gb_per_file is not None or not self.meta["is_multipage"],
+            write_options=_get_tiff_write_options(
+                compression, predictor, tile, encode_workers
+            ),
+            spatial_bin=spatial_bin,
+            temporal_bin=temporal_bin,
+        )
+
+        return output_tiff_list[0] if gb_per_file is None else output_tiff_list
+
+    def write_all_bigtiffs(
+        self,
+        output_prefix=None,
+        output_dir="./",
+        overwrite=False,
+        gb_per_file=None,
+        n_workers=None,
+        compression=None,
+        predictor=None,
+        tile=None,
+        encode_workers=None,
+        spatial_bin=1,
+        temporal_bin=1,
+    ) -> dict:
+        """Write the frames of every plane and channel to BigTIFF, in a single pass
+
+        Each input file (or page) is read once, and its frame is passed to the
+        writer of its plane and channel, each writing in its own thread. The output
+        files are the same as those of `write_single_bigtiff` for each plane and
+        channel.
+
+        Args:
+            output_prefix: str - prefix of the output file names, defaults to the
+                common prefix of the input file names of each plane and channel
+            output_dir: output directory
+            overwrite: bool - if True, overwrite existing output files
+            gb_per_file: float - if given, split the output in files of at most this
+                many GB of image data
+            n_workers: int - number of threads reading single-page tiff files ahead
+                of the writers
+            compression: str - lossless compression of the output, e.g. "zlib" or
+                "zstd" ("zstd" needs `imagecodecs` to write and read), or a tuple of
+                (compression, level)
+            predictor: bool - if True, apply the horizontal differencing predictor
+                before compression
+            tile: tuple - (height, width) of the output tiles, multiples of 16, if
+                any, else the frames are written in strips
+            encode_workers: int - number of threads compressing each output file
+            spatial_bin: int - average the frames over blocks of `spatial_bin` x
+                `spatial_bin` pixels
+            temporal_bin: int - average every `temporal_bin` frames
+
+        Returns: dict - (plane_idx, channel): the output file, or the list of output
+            files if `gb_per_file` is given
+
+        Example:
+            > pv_meta = PrairieViewMeta(prairieview_dir)
+            > output_tiffs = pv_meta.write_all_bigtiffs(output_dir=output_dir)
+            > output_tiffs[(plane_idx, channel)]
+        """
+        output_dir = Path(output_dir)
+        output_tiffs, output_tiff_stems = {}, {}
+        for plane_idx in self.meta["plane_indices"]:
+            for channel in self.meta["channels"]:
+                output_tiff_stem = self._get_output_tiff_stem(
+                    plane_idx, channel, output_prefix=output_prefix
+                )
+                output_tiff_list = list(output_dir.glob(f"{output_tiff_stem}*.tif"))
+                if len(output_tiff_list) and not overwrite:
+                    output_tiffs[(plane_idx, channel)] = (
+                        output_tiff_list[0] if gb_per_file is None else output_tiff_list
+                    )
+                    continue
+                # delete old tif files if overwrite is True
+                [f.unlink() for f in output_tiff_list]
+                output_tiff_stems[(plane_idx, channel)] = output_tiff_stem
+
+        if not output_tiff_stems:
+            return output_tiffs
+
+        is_selected = np.zeros(len(self.frame_index), dtype=bool)
+        for plane_idx, channel in output_tiff_stems:
+            is_selected |= (self.frame_index["plane"] == plane_idx) & (
+                self.frame_index["channel"] == channel
+            )
+        frame_index = self.frame_index[is_selected]
+        if self.meta["is_multipage"]:
+            frames = self._iter_multipage_frames(frame_index)
+        else:
+            frames = self._iter_singlepage_frames(frame_index, n_workers=n_workers)
+
+        write_options = _get_tiff_write_options(
+            compression, predictor, tile, encode_workers
+        )
+        frame_queues = {key: queue.Queue(maxsize=16) for key in output_tiff_stems}
+        stop_writing = threading.Event()
+        with ThreadPoolExecutor(max_workers=len(output_tiff_stems)) as executor:
+            n_frames = {
+                (plane_idx, channel): int(
+                    np.count_nonzero(
+                        (frame_index["plane"] == plane_idx)
+                        & (frame_index["channel"] == channel)
+                    )
+                )
+                for plane_idx, channel in output_tiff_stems
+            }
+            writers = {
+                key: executor.submit(
+                    self._write_bigtiff_files,
+                    _iter_frame_queue(frame_queues[key], n_frames[key], stop_writing),
+                    n_frames=n_frames[key],
+                    output_dir=output_dir,
+                    output_tiff_stem=output_tiff_stem,
+                    gb_per_file=gb_per_file,
+                    numbered=gb_per_file is not None or not self.meta["is_multipage"],
+                    write_options=write_options,
+                    spatial_bin=spatial_bin,
+                    temporal_bin=temporal_bin,
+                )
+                for key, output_tiff_stem in output_tiff_stems.items()
+            }
+            try:
+                for plane_idx, channel, frame in zip(
+                    frame_index["plane"], frame_index["channel"], frames
+                ):
+                    key = (int(plane_idx), int(channel))
+                    _put_frame(frame_queues[key], frame, writers[key])
+            except BaseException:
+                stop_writing.set()
+                raise
+            finally:
+                frames.close()
+
+        for key, writer in writers.items():
+            output_tiff_list = writer.result()
+            output_tiffs[key] = (
+                output_tiff_list[0] if gb_per_file is None else output_tiff_list
+            )
+        return output_tiffs
+
+    def write_hdf5(
+        self,
+        plane_idx=None,
+        channel=None,
+        output_prefix=None,
+        output_dir="./",
+        h5py_key="mov",
+        chunk_shape=None,
+        compression=None,
+        compression_opts=None,
+        overwrite=False,
+        n_workers=None,
+        spatial_bin=1,
+        temporal_bin=1,
+    ):
+        """Write the frames of one plane and channel to a chunked HDF5 dataset
+
+        The (frame x height x width) dataset has the attributes "axes" ("TYX"),
+        "frame_rate", "plane_idx", "channel", "fieldZ" (depth of the plane),
+        "height_in_um", "width_in_um" and "pixel_size_um". It can be read in temporal windows, and
+        used as the `h5py`/`h5py_key` input of Suite2p, or the `fnames`/
+        `var_name_hdf5` input of CaImAn.
+
+        Args:
+            plane_idx: int - plane index
+            channel: int - channel
+            output_prefix: str - prefix of the output file name, defaults to the
+                common prefix of the input file names
+            output_dir: output directory
+            h5py_key: str - name of the dataset
+            chunk_shape: tuple - (frame, height, width) chunk shape, defaults to
+                whole frames, about 4 MB per chunk
+            compression: str - HDF5 compression filter, e.g. "gzip" or "lzf"
+            compression_opts: compression level of the filter, if any
+            overwrite: bool - if True, overwrite an existing output file
+            n_workers: int - number of threads reading single-page tiff files ahead
+                of the writer
+            spatial_bin: int - average the frames over blocks of `spatial_bin` x
+                `spatial_bin` pixels
+            temporal_bin: int - average every `temporal_bin` frames
+
+        Returns: Path - the output .h5 file
+
+        Example:
+            > output_h5 = pv_meta.write_hdf5(plane_idx=1, channel=2, h5py_key="data")
+            > db = {"h5py": [output_h5], "h5py_key": "data"}
+        """
+        _, plane_idx, channel = self.get_prairieview_filenames(
+            plane_idx=plane_idx, channel=channel, return_pln_chn=True
+        )
+        output_h5_fullpath = Path(output_dir) / (
+            self._get_output_tiff_stem(plane_idx, channel, output_prefix=output_prefix)
+            + ".h5"
+        )
+        if output_h5_fullpath.exists() and not overwrite:
+            return output_h5_fullpath
+
+        frame_index = self.get_frame_index(plane_idx=plane_idx, channel=channel)
         if self.meta["is_multipage"]:
-            if gb_per_file is not None:
-                logger.warning(
-                    "Ignoring `gb_per_file` argument for multi-page tiff (NotYetImplemented)"
+            frames = self._iter_multipage_frames(frame_index)
+        else:
+            frames = self._iter_singlepage_frames(frame_index, n_workers=n_workers)
+        n_frames = len(frame_index)
+        if spatial_bin > 1 or temporal_bin > 1:
+            frames = _bin_frames(frames, spatial_bin, temporal_bin)
+            n_frames = math.ceil(n_frames / temporal_bin)
+        metadata = self._get_output_metadata(spatial_bin, temporal_bin)
+
+        try:
+            first_frame = next(frames)
+            if chunk_shape is None:
+                chunk_shape = (
+                    max(1, 4 * 1024**2 // first_frame.nbytes),
+                    *first_frame.shape,
+                )
+            chunk_shape = (min(chunk_shape[0], n_frames), *chunk_shape[1:])
+            plane_z = np.atleast_1d(self.meta["fieldZ"])
+            with h5py.File(output_h5_fullpath, "w") as h5f:
+                dataset = h5f.create_dataset(
+                    h5py_key,
+                    shape=(n_frames, *first_frame.shape),
+                    dtype=first_frame.dtype,
+                    chunks=tuple(chunk_shape),
+                    compression=compression,
+                    compression_opts=compression_opts,
+                )
+                dataset.attrs.update(
+                    axes="TYX",
+                    frame_rate=metadata["'fps'"],
+                    plane_idx=plane_idx,
+                    channel=channel,
+                    fieldZ=plane_z[
+                        self.meta["plane_indices"].index(plane_idx)
+                        if plane_z.size > 1
+                        else 0
+                    ],
+                    height_in_um=self.meta["height_in_um"],
+                    width_in_um=self.meta["width_in_um"],
+                    pixel_size_um=metadata["'pixel_size_um'"],
                 )
-            # For multi-page tiff - the pages are organized as:
-            # (channel x slice x frame) - each page is (height x width)
-            # - TODO: verify this is the case for Bruker multi-page tiff
-            # This implementation is partially based on the reference code from `scanreader` package - https://github.com/atlab/scanreader
-            # See: https://github.com/atlab/scanreader/blob/2a021a85fca011c17e553d0e1c776998d3f2b2d8/scanreader/scans.py#L337
-            slice_step = self.meta["num_channels"]
-            frame_step = self.meta["num_channels"] * self.meta["num_planes"]
-            slice_idx = self.meta["plane_indices"].index(plane_idx)
-            channel_idx = self.meta["channels"].index(channel)
+                # write whole chunks of frames at a time
+                chunk = np.empty(
+                    (chunk_shape[0], *first_frame.shape), first_frame.dtype
+                )
+                all_frames = itertools.chain([first_frame], frames)
+                for start_frame in range(0, n_frames, chunk_shape[0]):
+                    frame_count = min(chunk_shape[0], n_frames - start_frame)
+                    for i, frame in enumerate(
+                        itertools.islice(all_frames, frame_count)
+                    ):
+                        chunk[i] = frame
+                    dataset[start_frame : start_frame + frame_count] = chunk[
+                        :frame_count
+                    ]
+        except BaseException:
+            output_h5_fullpath.unlink(missing_ok=True)
+            raise
+        finally:
+            frames.close()
+
+        return output_h5_fullpath
+
+    def get_movie(
+        self, plane_idx=None, channel=None, max_open_files=8, max_cached_frames=64
+    ):
+        """Lazy (frame x height x width) array of one plane and channel
+
+        Frames are read from the .ome.tif files on indexing, with no conversion.
+
+        Args:
+            plane_idx: int - plane index
+            channel: int - channel
+            max_open_files: int - number of tiff files kept open
+            max_cached_frames: int - number of decoded frames kept in memory
 
+        Returns: PrairieViewMovie - numpy-like array of the frames
+
+        Example:
+            > movie = pv_meta.get_movie(plane_idx=1, channel=2)
+            > movie[100:200].mean(axis=0)
+        """
+        _, plane_idx, channel = self.get_prairieview_filenames(
+            plane_idx=plane_idx, channel=channel, return_pln_chn=True
+        )
+        frame_index = self.get_frame_index(plane_idx=plane_idx, channel=channel)
+        # cached page offsets of the multi-page files of the frames, if any
+        page_index = None
+        if self.meta["is_multipage"]:
             page_indices = [
-                frame_idx * frame_step + slice_idx * slice_step + channel_idx
-                for frame_idx in range(self.meta["num_frames"])
+                self._get_file_page_index(file_id)
+                for file_id in np.unique(frame_index["file_id"]).tolist()
             ]
+            page_index = np.concatenate(
+                [np.empty(0, dtype=_page_index_dtype)]
+                + [rows for rows in page_indices if rows is not None]
+            )
+        return PrairieViewMovie(
+            self.prairieview_dir,
+            self.filenames,
+            frame_index,
+            max_open_files=max_open_files,
+            max_cached_frames=max_cached_frames,
+            page_index=page_index,
+        )
 
-            combined_data = np.empty(
-                [
-                    self.meta["num_frames"],
-                    self.meta["height_in_pixels"],
-                    self.meta["width_in_pixels"],
-                ],
-                dtype=np.uint16, # use unsigned int 16 instead of int. int is defined as 32 or 64 bit based on the platform -> this will inflated a 16 bit tiff by 2 to 4 times!
+    def get_summary_images(self, preview_bin=None, n_workers=None, use_cache=True):
+        """Mean, max and standard deviation images of every plane and channel
+
+        The images are computed from the raw tiff files, read once by a pool of
+        `n_workers` threads, each reducing a block of files to running statistics
+        merged as they complete. Each multi-page file is read in a single block. The results are cached next to the .xml file
+        (`.<xml stem>_summary_images.npz`).
+
+        Args:
+            preview_bin: int - if given, also return a temporally binned preview
+                movie, the average of every `preview_bin` frames
+            n_workers: int - number of threads reading the tiff files
+            use_cache: bool - read/write the cached summary images
+
+        Returns: dict - (plane_idx, channel): dict of "mean_image", "max_image",
+            "std_image" (height x width) and, with `preview_bin`, "preview"
+            (frame / preview_bin x height x width)
+
+        Example:
+            > summary_images = pv_meta.get_summary_images(preview_bin=100)
+            > summary_images[(plane_idx, channel)]["mean_image"]
+        """
+        if use_cache:
+            summary_images = _load_summary_images_cache(self.xml_file, preview_bin)
+            if summary_images is not None:
+                return summary_images
+
+        # position of each frame in the movie of its plane and channel
+        frame_positions = np.empty(len(self.frame_index), dtype=int)
+        for plane_idx in self.meta["plane_indices"]:
+            for channel in self.meta["channels"]:
+                is_selected = (self.frame_index["plane"] == plane_idx) & (
+                    self.frame_index["channel"] == channel
+                )
+                frame_positions[is_selected] = np.arange(np.count_nonzero(is_selected))
+
+        # blocks of at least 64 frames, not splitting any file
+        if self.meta["is_multipage"]:
+            frame_order = np.lexsort(
+                (self.frame_index["page"], self.frame_index["file_id"])
+            )
+            file_starts = np.flatnonzero(
+                np.diff(self.frame_index["file_id"][frame_order], prepend=-1)
             )
-            start_page = 0
+        else:
+            frame_order = np.arange(len(self.frame_index))
+            file_starts = frame_order
+        block_starts = [0]
+        for file_start in file_starts[1:]:
+            if file_start - block_starts[-1] >= 64:
+                block_starts.append(file_start)
+        block_stops = block_starts[1:] + [len(frame_order)]
+
+        n_workers = n_workers or min(32, (os.cpu_count() or 1) + 4)
+        stats = {}
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
             try:
-                for input_file in tiff_names:
-                    with tifffile.TiffFile((self.prairieview_dir / input_file).as_posix()) as tffl:
-                        # Get indices in this tiff file and in output array
-                        final_page_in_file = start_page + len(tffl.pages)
-                        is_page_in_file = lambda page: page in range(
-                            start_page, final_page_in_file
+                for block_start, block_stop in zip(block_starts, block_stops):
+                    block_rows = frame_order[block_start:block_stop]
+                    pending.append(
+                        executor.submit(
+                            self._summarize_frames,
+                            self.frame_index[block_rows],
+                            frame_positions[block_rows],
+                            preview_bin,
                         )
-                        pages_in_file = filter(is_page_in_file, page_indices)
-                        file_indices = [page - start_page for page in pages_in_file]
-                        global_indices = [
-                            is_page_in_file(page) for page in page_indices
-                        ]
-
-                        # Read from this tiff file (if needed)
-                        if len(file_indices) > 0:
-                            # this line looks a bit ugly but is memory efficient. Do not separate
-                            combined_data[global_indices] = tffl.asarray(
-                                key=file_indices
-                            )
-                        start_page += len(tffl.pages)
-            except Exception as e:
-                raise Exception(f"Error in processing tiff file {input_file}: {e}")
-
-            output_tiff_fullpath = output_dir / f"{output_tiff_stem}.tif"
-            tifffile.imwrite(
-                output_tiff_fullpath.as_posix(),
-                combined_data,
-                metadata={"axes": "TYX", "'fps'": self.meta["frame_rate"]},
-                bigtiff=True,
+                    )
+                    if len(pending) >= 2 * n_workers:
+                        _merge_frame_stats(stats, pending.popleft().result())
+                while pending:
+                    _merge_frame_stats(stats, pending.popleft().result())
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        summary_images = {}
+        for key, (n_frames, mean, m2, max_image, preview_sums) in sorted(stats.items()):
+            summary_images[key] = dict(
+                mean_image=mean.astype(np.float32),
+                max_image=max_image,
+                std_image=np.sqrt(m2 / n_frames).astype(np.float32),
+            )
+            if preview_bin:
+                n_bins = math.ceil(n_frames / preview_bin)
+                bin_counts = np.full(n_bins, preview_bin)
+                bin_counts[-1] = n_frames - preview_bin * (n_bins - 1)
+                summary_images[key]["preview"] = (
+                    np.stack([preview_sums[bin_id] for bin_id in range(n_bins)])
+                    / bin_counts[:, None, None]
+                ).astype(np.float32)
+
+        if use_cache:
+            _save_summary_images_cache(self.xml_file, preview_bin, summary_images)
+        return summary_images
+
+    def _summarize_frames(self, frame_index, frame_positions, preview_bin=None):
+        """Running statistics of the frames of `frame_index` rows, per plane and channel
+
+        Returns: dict - (plane_idx, channel): [frame count, mean, sum of squared
+            deviations from the mean, max, {preview bin: sum of frames}]
+        """
+        if self.meta["is_multipage"]:
+            frames = self._iter_multipage_frames(frame_index)
+        else:
+            frames = (
+                self._read_single_page(self.filenames[file_id])
+                for file_id in frame_index["file_id"]
+            )
+        stats = {}
+        try:
+            for row, frame_position, frame in zip(frame_index, frame_positions, frames):
+                key = (int(row["plane"]), int(row["channel"]))
+                if key not in stats:
+                    stats[key] = [
+                        0,
+                        np.zeros(frame.shape),
+                        np.zeros(frame.shape),
+                        frame,
+                        {},
+                    ]
+                key_stats = stats[key]
+                # Welford's online mean and variance
+                key_stats[0] += 1
+                delta = frame - key_stats[1]
+                key_stats[1] += delta / key_stats[0]
+                key_stats[2] += delta * (frame - key_stats[1])
+                key_stats[3] = np.maximum(key_stats[3], frame)
+                if preview_bin:
+                    bin_id = int(frame_position) // preview_bin
+                    preview_sums = key_stats[4]
+                    if bin_id in preview_sums:
+                        preview_sums[bin_id] += frame
+                    else:
+                        preview_sums[bin_id] = frame.astype(np.float64)
+        finally:
+            frames.close()
+        return stats
+
+    def _get_output_tiff_stem(self, plane_idx, channel, output_prefix=None) -> str:
+        if output_prefix is None:
+            output_prefix = os.path.commonprefix(
+                self.get_prairieview_filenames(plane_idx=plane_idx, channel=channel)
+            )
+        return f"{output_prefix}_pln{plane_idx}_chn{channel}"
+
+    def _iter_multipage_frames(self, frame_index: np.ndarray, max_open_files=8):
+        """Yield the frames of `frame_index` rows in order, reading page by page
+
+        The last `max_open_files` input files are kept open, so that the files of
+        interleaved frames (e.g. one multi-page file per channel) are opened once.
+        """
+        open_files = collections.OrderedDict()  # file_id: (file, page index rows)
+        try:
+            for file_id, page in frame_index[["file_id", "page"]].tolist():
+                input_file = self.filenames[file_id]
+                try:
+                    if file_id in open_files:
+                        open_files.move_to_end(file_id)
+                    else:
+                        open_files[file_id] = self._open_multipage_file(file_id)
+                        if len(open_files) > max(1, max_open_files):
+                            _, (oldest_file, _) = open_files.popitem(last=False)
+                            oldest_file.close()
+                    f, index_rows = open_files[file_id]
+                    if index_rows is not None:
+                        frame = _read_indexed_page(f, index_rows[page])
+                    else:
+                        frame = f.pages[page].asarray()
+                except Exception as e:
+                    raise Exception(f"Error in processing tiff file {input_file}: {e}")
+                yield frame
+        finally:
+            for f, _ in open_files.values():
+                f.close()
+            self._save_page_index()
+
+    def _open_multipage_file(self, file_id: int):
+        """Open a multi-page file, as (file, page index rows) to read its pages
+
+        Files of uncompressed pages in the page index are opened as raw binary
+        files, read directly at the page offsets, the others as TiffFile (with no
+        page index rows), indexing the file on its first read.
+        """
+        input_path = (self.prairieview_dir / self.filenames[file_id]).as_posix()
+        index_rows = self._get_file_page_index(file_id)
+        if index_rows is not None and (index_rows["offset"] >= 0).all():
+            return open(input_path, "rb"), index_rows
+        tffl = tifffile.TiffFile(input_path)
+        if index_rows is None:
+            self._add_file_page_index(file_id, tffl)
+        return tffl, None
+
+    def _iter_singlepage_frames(self, frame_index: np.ndarray, n_workers=None):
+        """Yield the frames of `frame_index` rows in order, from single-page files
+
+        The files are read by a pool of `n_workers` threads, up to 2 * `n_workers`
+        files ahead of the frame being yielded.
+        """
+        n_workers = n_workers or min(32, (os.cpu_count() or 1) + 4)
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            try:
+                for file_id in frame_index["file_id"]:
+                    pending.append(
+                        executor.submit(self._read_single_page, self.filenames[file_id])
+                    )
+                    if len(pending) >= 2 * n_workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _read_single_page(self, input_file: str) -> np.ndarray:
+        try:
+            with tifffile.TiffFile(
+                (self.prairieview_dir / input_file).as_posix()
+            ) as tffl:
+                assert len(tffl.pages) == 1
+                return tffl.pages[0].asarray()
+        except Exception as e:
+            raise Exception(f"Error in processing tiff file {input_file}: {e}")
+
+    def _write_bigtiff_files(
+        self,
+        frames,
+        n_frames: int,
+        output_dir: Path,
+        output_tiff_stem: str,
+        gb_per_file=None,
+        numbered=True,
+        write_options=None,
+        spatial_bin=1,
+        temporal_bin=1,
+    ) -> list:
+        """Write frames to BigTIFF files of at most `gb_per_file` of image data
+
+        Args:
+            frames: iterator of (height x width) frames, closed once written
+            n_frames: int - number of frames
+            output_dir: output directory
+            output_tiff_stem: str - output file stem
+            gb_per_file: float - maximum size of each output file in GB, if any
+            numbered: bool - if True, the output files are "<stem>_0000.tif",
+                "<stem>_0001.tif", etc., otherwise a single "<stem>.tif"
+            write_options: dict - compression, predictor, tile and maxworkers
+                arguments of `tifffile.TiffWriter.write`
+            spatial_bin: int - average the frames over blocks of `spatial_bin` x
+                `spatial_bin` pixels
+            temporal_bin: int - average every `temporal_bin` frames
+
+        Returns: List[Path] - the output files
+        """
+        if spatial_bin > 1 or temporal_bin > 1:
+            frames = _bin_frames(frames, spatial_bin, temporal_bin)
+            n_frames = math.ceil(n_frames / temporal_bin)
+        metadata = self._get_output_metadata(spatial_bin, temporal_bin)
+        output_tiff_list = []
+        try:
+            first_frame = next(frames)
+            frames_per_file = (
+                n_frames
+                if gb_per_file is None
+                else max(1, math.ceil(gb_per_file * 1024**3 / first_frame.nbytes))
+            )
+            all_frames = itertools.chain([first_frame], frames)
+            for start_frame in range(0, n_frames, frames_per_file):
+                output_tiff_fullpath = output_dir / (
+                    f"{output_tiff_stem}_{len(output_tiff_list):04}.tif"
+                    if numbered
+                    else f"{output_tiff_stem}.tif"
+                )
+                file_frame_count = min(frames_per_file, n_frames - start_frame)
+                self._write_frames(
+                    output_tiff_fullpath,
+                    itertools.islice(all_frames, file_frame_count),
+                    shape=(file_frame_count, *first_frame.shape),
+                    dtype=first_frame.dtype,
+                    metadata=metadata,
+                    write_options=write_options,
+                )
+                output_tiff_list.append(output_tiff_fullpath)
+        finally:
+            frames.close()
+        return output_tiff_list
+
+    def _get_output_metadata(self, spatial_bin=1, temporal_bin=1) -> dict:
+        """Metadata of the converted movie, binned by `spatial_bin` and `temporal_bin`"""
+        return {
+            "axes": "TYX",
+            "'fps'": self.meta["frame_rate"] / temporal_bin,
+            "'pixel_size_um'": [
+                self.meta["height_in_um"] / self.meta["height_in_pixels"] * spatial_bin,
+                self.meta["width_in_um"] / self.meta["width_in_pixels"] * spatial_bin,
+            ],
+        }
+
+    def _write_frames(
+        self,
+        output_tiff_fullpath: Path,
+        frames,
+        shape,
+        dtype,
+        metadata=None,
+        write_options=None,
+    ):
+        """Write frames, one at a time, as a (frame x height x width) BigTIFF series
+
+        Args:
+            output_tiff_fullpath: output file
+            frames: iterable of (height x width) frames
+            shape: tuple - (frame, height, width) shape of the series
+            dtype: data type of the frames
+            metadata: dict - metadata of the series, defaults to the frame rate
+            write_options: dict - compression, predictor, tile and maxworkers
+                arguments of `tifffile.TiffWriter.write`
+        """
+        write_options = write_options or {}
+        if write_options.get("tile"):
+            # tifffile expects an iterator of tiles for tiled output
+            frames = _iter_tiles(frames, write_options["tile"])
+        with tifffile.TiffWriter(
+            output_tiff_fullpath.as_posix(), bigtiff=True
+        ) as tiff_writer:
+            tiff_writer.write(
+                frames,
+                shape=shape,
+                dtype=dtype,
+                photometric="minisblack",
+                metadata=metadata or self._get_output_metadata(),
+                **write_options,
             )
-            output_tiff_list.append(output_tiff_fullpath)
+
+
+class PrairieViewMovie:
+    """Read-only, numpy-like (frame x height x width) array over PrairieView tiff files
+
+    Indexing reads the frames from their file and page, keeping the last
+    `max_open_files` files open and the last `max_cached_frames` frames decoded.
+    Uncompressed pages of the `page_index` are read directly at their data offset.
+    The first axis may be indexed with an int, a slice, or a list/array of indices
+    or booleans; the other axes as a numpy array.
+
+    Example:
+        > movie = PrairieViewMeta(prairieview_dir).get_movie(plane_idx=1, channel=2)
+        > movie.shape
+        > movie[0]  # first frame
+        > movie[::10, 100:200, 100:200]  # every 10th frame, cropped
+        > for frame in movie:  # frames in order
+    """
+
+    def __init__(
+        self,
+        prairieview_dir: str,
+        filenames: np.ndarray,
+        frame_index: np.ndarray,
+        max_open_files=8,
+        max_cached_frames=64,
+        page_index=None,
+    ):
+        """Initialize PrairieViewMovie
+
+        Args:
+            prairieview_dir (str): directory of the PrairieView dataset
+            filenames (np.ndarray): file name of each `file_id` of frame_index
+            frame_index (np.ndarray): `PrairieViewMeta.frame_index` rows of the frames
+            max_open_files (int): number of tiff files kept open
+            max_cached_frames (int): number of decoded frames kept in memory
+            page_index (np.ndarray): optional `PrairieViewMeta.page_index` of the files
+        """
+        self.prairieview_dir = Path(prairieview_dir)
+        self.filenames = filenames
+        self.frame_index = frame_index
+        self.max_open_files = max_open_files
+        self.max_cached_frames = max_cached_frames
+        self._open_files = collections.OrderedDict()
+        self._cached_frames = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._page_offsets = {}
+        if page_index is not None:
+            for file_id in np.unique(frame_index["file_id"]).tolist():
+                index_rows = _get_page_index_rows(page_index, file_id)
+                if len(index_rows) and (index_rows["offset"] >= 0).all():
+                    self._page_offsets[file_id] = index_rows
+
+        first_file_id, first_page = frame_index[["file_id", "page"]][0].tolist()
+        if first_file_id in self._page_offsets:
+            index_row = self._page_offsets[first_file_id][first_page]
+            self.shape = (
+                len(frame_index),
+                int(index_row["height"]),
+                int(index_row["width"]),
+            )
+            self.dtype = np.dtype(index_row["dtype"].decode()).newbyteorder("=")
         else:
-            while len(tiff_names):
-                output_tiff_fullpath = (
-                    output_dir / f"{output_tiff_stem}_{len(output_tiff_list):04}.tif"
+            page = self._get_tiff_file(first_file_id).pages[first_page]
+            self.shape = (len(frame_index), *page.shape)
+            self.dtype = page.dtype
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def __iter__(self):
+        for frame_id in range(len(self)):
+            yield self[frame_id]
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if not key or key[0] is Ellipsis:
+            frame_key, frame_subkey = slice(None), key
+        else:
+            frame_key, frame_subkey = key[0], key[1:]
+
+        if isinstance(frame_key, (int, np.integer)):
+            frame_id = int(frame_key)
+            if not -len(self) <= frame_id < len(self):
+                raise IndexError(
+                    f"index {frame_id} is out of bounds for axis 0 with size {len(self)}"
                 )
-                with tifffile.TiffWriter(
-                    output_tiff_fullpath.as_posix(),
-                    bigtiff=True,
-                ) as tiff_writer:
-                    while len(tiff_names):
-                        input_file = tiff_names.pop(0)
-                        try:
-                            with tifffile.TiffFile(
-                                (self.prairieview_dir / input_file).as_posix()
-                            ) as tffl:
-                                assert len(tffl.pages) == 1
-                                tiff_writer.write(
-                                    tffl.pages[0].asarray(),
-                                    metadata={
-                                        "axes": "YX",
-                                        "'fps'": self.meta["frame_rate"],
-                                    },
-                                )
-                            # additional safeguard to close the file and delete the object
-                            # in the attempt to prevent error: `not a TIFF file b''`
-                            tffl.close()
-                            del tffl
-                        except Exception as e:
-                            raise Exception(
-                                f"Error in processing tiff file {input_file}: {e}"
-                            )
-                        if (
-                            gb_per_file
-                            and output_tiff_fullpath.stat().st_size
-                            >= gb_per_file * 1024**3
-                        ):
-                            break
-                    output_tiff_list.append(output_tiff_fullpath)
+            return self._read_frame(frame_id % len(self))[frame_subkey].copy()
 
-        return output_tiff_list[0] if gb_per_file is None else output_tiff_list
+        frame_ids = np.arange(len(self))[frame_key]
+        if not frame_ids.size:
+            return np.empty((0, *self.shape[1:]), dtype=self.dtype)[
+                (slice(None), *frame_subkey)
+            ]
+        return np.stack(
+            [self._read_frame(frame_id)[frame_subkey] for frame_id in frame_ids]
+        )
+
+    def close(self):
+        """Close the open tiff files and clear the cached frames"""
+        with self._lock:
+            for tffl in self._open_files.values():
+                tffl.close()
+            self._open_files.clear()
+            self._cached_frames.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _read_frame(self, frame_id: int) -> np.ndarray:
+        file_id, page = self.frame_index[["file_id", "page"]][frame_id].tolist()
+        with self._lock:
+            if (file_id, page) in self._cached_frames:
+                self._cached_frames.move_to_end((file_id, page))
+                return self._cached_frames[(file_id, page)]
+
+            if file_id in self._page_offsets:
+                frame = _read_indexed_page(
+                    self._get_tiff_file(file_id), self._page_offsets[file_id][page]
+                )
+            else:
+                frame = self._get_tiff_file(file_id).pages[page].asarray()
+            frame.flags.writeable = False
+            if self.max_cached_frames:
+                self._cached_frames[(file_id, page)] = frame
+                if len(self._cached_frames) > self.max_cached_frames:
+                    self._cached_frames.popitem(last=False)
+        return frame
+
+    def _get_tiff_file(self, file_id: int):
+        """Open TiffFile, or raw binary file for the files with page offsets"""
+        if file_id in self._open_files:
+            self._open_files.move_to_end(file_id)
+            return self._open_files[file_id]
+
+        tiff_filepath = self.prairieview_dir / self.filenames[file_id]
+        if file_id in self._page_offsets:
+            tffl = open(tiff_filepath, "rb")
+        else:
+            tffl = tifffile.TiffFile(tiff_filepath.as_posix())
+        self._open_files[file_id] = tffl
+        if len(self._open_files) > max(1, self.max_open_files):
+            _, oldest_tffl = self._open_files.popitem(last=False)
+            oldest_tffl.close()
+        return tffl
+
+
+def _merge_frame_stats(stats: dict, block_stats: dict):
+    """Merge the running statistics of a block of frames into `stats`, in place"""
+    for key, (n_b, mean_b, m2_b, max_b, preview_sums_b) in block_stats.items():
+        if key not in stats:
+            stats[key] = [n_b, mean_b, m2_b, max_b, preview_sums_b]
+            continue
+        n_a, mean_a, m2_a, max_a, preview_sums_a = stats[key]
+        # Chan et al. pairwise combination of mean and variance
+        n_frames = n_a + n_b
+        delta = mean_b - mean_a
+        mean_a += delta * (n_b / n_frames)
+        m2_a += m2_b + delta**2 * (n_a * n_b / n_frames)
+        stats[key][0] = n_frames
+        stats[key][3] = np.maximum(max_a, max_b)
+        for bin_id, preview_sum in preview_sums_b.items():
+            if bin_id in preview_sums_a:
+                preview_sums_a[bin_id] += preview_sum
+            else:
+                preview_sums_a[bin_id] = preview_sum
+
+
+def _bin_frames(frames, spatial_bin=1, temporal_bin=1):
+    """Yield the average of every `temporal_bin` frames over `spatial_bin` pixel blocks
+
+    The last rows and columns of pixels not filling a block are dropped; the last
+    frame is the average of the remaining frames. The frames keep their data type.
+    """
+    try:
+        frame_sum, frame_count = None, 0
+        for frame in frames:
+            height = frame.shape[0] // spatial_bin * spatial_bin
+            width = frame.shape[1] // spatial_bin * spatial_bin
+            if frame_count == 0:
+                frame_sum = np.zeros((height // spatial_bin, width // spatial_bin))
+            # add the strided views of each pixel of the blocks, without copies
+            for y in range(spatial_bin):
+                for x in range(spatial_bin):
+                    frame_sum += frame[y:height:spatial_bin, x:width:spatial_bin]
+            frame_count += 1
+            if frame_count == temporal_bin:
+                yield _cast_frame(
+                    frame_sum / (frame_count * spatial_bin**2), frame.dtype
+                )
+                frame_count = 0
+        if frame_count:
+            yield _cast_frame(frame_sum / (frame_count * spatial_bin**2), frame.dtype)
+    finally:
+        frames.close()
+
+
+def _cast_frame(frame: np.ndarray, dtype) -> np.ndarray:
+    if np.issubdtype(dtype, np.integer):
+        frame = np.rint(frame)
+    return frame.astype(dtype)
+
+
+def _get_tiff_write_options(
+    compression=None, predictor=None, tile=None, encode_workers=None
+) -> dict:
+    """Arguments of `tifffile.TiffWriter.write` for the compression options"""
+    write_options = {}
+    if compression:
+        if isinstance(compression, (tuple, list)):
+            compression, level = compression
+            write_options["compressionargs"] = {"level": level}
+        write_options["compression"] = compression
+        write_options["predictor"] = bool(predictor)
+    if tile:
+        write_options["tile"] = tuple(tile)
+    if encode_workers:
+        write_options["maxworkers"] = encode_workers
+    return write_options
+
+
+def _iter_tiles(frames, tile: tuple):
+    """Yield the (row major) tiles of each frame, edge tiles are not padded"""
+    tile_height, tile_width = tile
+    for frame in frames:
+        for y in range(0, frame.shape[0], tile_height):
+            for x in range(0, frame.shape[1], tile_width):
+                yield frame[y : y + tile_height, x : x + tile_width]
+
+
+def _iter_frame_queue(
+    frame_queue: queue.Queue, n_frames: int, stop_writing: threading.Event
+):
+    """Yield the `n_frames` frames put in `frame_queue`, or until `stop_writing` is set"""
+    for _ in range(n_frames):
+        while True:
+            try:
+                yield frame_queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if stop_writing.is_set():
+                    return
+
+
+def _put_frame(frame_queue: queue.Queue, frame: np.ndarray, writer: Future):
+    """Put `frame` in `frame_queue`, raising the error of `writer` if it failed"""
+    while True:
+        try:
+            frame_queue.put(frame, timeout=0.1)
+            return
+        except queue.Full:
+            if writer.done():
+                writer.result()
+                raise RuntimeError("Output tiff writer stopped before the last frame")
 
 
 def _extract_prairieview_metadata(xml_filepath: str):
     xml_filepath = Path(xml_filepath)
     if not xml_filepath.exists():
         raise FileNotFoundError(f"{xml_filepath} does not exist")
-    xml_tree = ET.parse(xml_filepath.as_posix())
-    xml_root = xml_tree.getroot()
+    parsed_xml = _parse_prairieview_xml(xml_filepath)
+    if parsed_xml is None:
+        raise ValueError(f"{xml_filepath} does not contain PrairieView scan metadata")
+    metainfo, _, _ = parsed_xml
+    return metainfo
+
+
+def _parse_prairieview_xml(xml_filepath: str):
+    """Extract the scan metadata from a PrairieView .xml file, in a single pass.
+
+    The file is read with `iterparse` and each "Frame" element is cleared once
+    processed, so memory use does not grow with the length of the recording.
+
+    Args:
+        xml_filepath: path to the .xml file
 
+    Returns:
+        None if the file does not contain any "Sequence/Frame", otherwise a tuple:
+            metainfo (dict): scan metadata (see `get_prairieview_metadata`)
+            frame_index (np.ndarray): structured array with one row per File of each
+                Frame, in file order (see `_frame_index_dtype`)
+            filenames (np.ndarray): File "filename" of each `file_id` of frame_index
+    """
     bidirectional_scan = False  # Does not support bidirectional
     roi = 0
-    is_multipage = xml_root.find(".//Sequence/Frame/File/[@page]") is not None
-    recording_start_time = xml_root.find(".//Sequence/[@cycle='1']").attrib.get("time")
 
-    # Get all channels and find unique values
-    channel_list = [
-        int(channel.attrib.get("channel"))
-        for channel in xml_root.iterfind(".//Sequence/Frame/File/[@channel]")
-    ]
-    channels = set(channel_list)
+    root = None
+    state_values = {}  # first value of each PVStateValue, in document order
+    first_z = None  # first "positionCurrent" ZAxis value, in document order
+    sequence_count = 0
+    bidirection_z = False
+    recording_start_time = None
+    n_frames = 0
+    last_relative_time = None
+    is_multipage = False
+    channels = set()
+    frame_files = []
+    planes = []  # Frame "index" of the frames in cycle 1
+    cycle2_has_z = False
+    cycle2_z_controllers = []  # ZAxis subindices of the frames with "index" 1
+    cycle2_z_values = {}  # ZAxis subindex: values of all frames in cycle 2
+
+    tags = []
+    sequence_elem = sequence = None
+    frame = None
+    for event, elem in ET.iterparse(xml_filepath, events=("start", "end")):
+        if event == "start":
+            tags.append(elem.tag)
+            if root is None:
+                root = elem
+            elif elem.tag == "Sequence":
+                sequence_elem = elem
+                sequence = dict(elem.attrib)
+                sequence_count += 1
+                if sequence_count == 1:
+                    bidirection_z = elem.attrib.get("bidirectionalZ") == "True"
+                if recording_start_time is None and sequence.get("cycle") == "1":
+                    recording_start_time = elem.attrib.get("time")
+            elif elem.tag == "Frame" and tags[-2] == "Sequence":
+                frame = dict(elem.attrib)
+            continue
+
+        tags.pop()
+        if elem.tag == "PVStateValue":
+            key = elem.attrib.get("key")
+            if key not in state_values:
+                state_values[key] = elem
+            elif key != "positionCurrent":
+                elem.clear()
+
+            if key == "positionCurrent":
+                z_values = [
+                    (z.attrib.get("subindex"), z.attrib.get("value"))
+                    for z in elem.findall(
+                        "./SubindexedValues/[@index='ZAxis']/SubindexedValue"
+                    )
+                ]
+                if first_z is None and z_values:
+                    first_z = z_values[0][1]
+                if (
+                    frame is not None
+                    and tags[-2:] == ["Frame", "PVStateShard"]
+                    and sequence.get("cycle") == "2"
+                    and elem.find("./SubindexedValues/[@index='ZAxis']") is not None
+                ):
+                    cycle2_has_z = True
+                    if frame.get("index") == "1":
+                        cycle2_z_controllers.extend(
+                            subindex for subindex, _ in z_values
+                        )
+                    for subindex, value in z_values:
+                        cycle2_z_values.setdefault(subindex, []).append(value)
+        elif elem.tag == "Frame" and tags and tags[-1] == "Sequence":
+            n_frames += 1
+            last_relative_time = elem.attrib.get("relativeTime")
+            if sequence.get("cycle") == "1":
+                planes.append(int(elem.attrib.get("index")))
+            for file in elem.iterfind("./File"):
+                is_multipage = is_multipage or "page" in file.attrib
+                if "channel" in file.attrib:
+                    channels.add(int(file.attrib["channel"]))
+                    frame_files.append(
+                        (
+                            int(sequence.get("cycle", 0)),
+                            int(elem.attrib.get("index")),
+                            int(file.attrib["channel"]),
+                            file.attrib.get("filename"),
+                            int(file.attrib.get("page", 1)),
+                            float(elem.attrib.get("relativeTime", "nan")),
+                            float(elem.attrib.get("absoluteTime", "nan")),
+                        )
+                    )
+            frame = None
+            sequence_elem.remove(elem)
+        elif elem.tag == "Sequence":
+            sequence = None
+            if len(tags) == 1:  # child of the root element
+                root.remove(elem)
+            else:
+                elem.clear()
+
+    if not n_frames:
+        return None
+
+    def _indexed_value(key, index):
+        return (
+            state_values[key]
+            .find(f"./IndexedValue/[@index='{index}']")
+            .attrib.get("value")
+        )
+
     n_channels = len(channels)
-    n_frames = len(xml_root.findall(".//Sequence/Frame"))
-    frame_period = float(
-        xml_root.findall('.//PVStateValue/[@key="framePeriod"]')[0].attrib.get("value")
-    )
+    frame_period = float(state_values["framePeriod"].attrib.get("value"))
 
     usec_per_line = (
-        float(
-            xml_root.findall(".//PVStateValue/[@key='scanLinePeriod']")[0].attrib.get(
-                "value"
-            )
-        )
-        * 1e6
+        float(state_values["scanLinePeriod"].attrib.get("value")) * 1e6
     )  # Convert from seconds to microseconds
 
-    scan_datetime = datetime.strptime(
-        xml_root.attrib.get("date"), "%m/%d/%Y %I:%M:%S %p"
-    )
+    scan_datetime = datetime.strptime(root.attrib.get("date"), "%m/%d/%Y %I:%M:%S %p")
 
-    total_scan_duration = float(
-        xml_root.findall(".//Sequence/Frame")[-1].attrib.get("relativeTime")
-    )
+    total_scan_duration = float(last_relative_time)
 
-    pixel_height = int(
-        xml_root.findall(".//PVStateValue/[@key='pixelsPerLine']")[0].attrib.get(
-            "value"
-        )
-    )
+    pixel_height = int(state_values["pixelsPerLine"].attrib.get("value"))
     # All PrairieView-acquired images have square dimensions (512 x 512; 1024 x 1024)
     pixel_width = pixel_height
 
-    um_per_pixel = float(
-        xml_root.find(
-            ".//PVStateValue/[@key='micronsPerPixel']/IndexedValue/[@index='XAxis']"
-        ).attrib.get("value")
-    )
+    um_per_pixel = float(_indexed_value("micronsPerPixel", "XAxis"))
 
     um_height = um_width = float(pixel_height) * um_per_pixel
 
     # x and y coordinate values for the center of the field
-    x_field = float(
-        xml_root.find(
-            ".//PVStateValue/[@key='currentScanCenter']/IndexedValue/[@index='XAxis']"
-        ).attrib.get("value")
-    )
-    y_field = float(
-        xml_root.find(
-            ".//PVStateValue/[@key='currentScanCenter']/IndexedValue/[@index='YAxis']"
-        ).attrib.get("value")
-    )
+    x_field = float(_indexed_value("currentScanCenter", "XAxis"))
+    y_field = float(_indexed_value("currentScanCenter", "YAxis"))
 
-    if (
-        xml_root.find(
-            ".//Sequence/[@cycle='2']/Frame/PVStateShard/PVStateValue/[@key='positionCurrent']/SubindexedValues/[@index='ZAxis']"
-        )
-        is None
-    ):
-        z_fields = np.float64(
-            xml_root.find(
-                ".//PVStateValue/[@key='positionCurrent']/SubindexedValues/[@index='ZAxis']/SubindexedValue"
-            ).attrib.get("value")
-        )
+    if not cycle2_has_z:
+        z_fields = np.float64(first_z)
         n_depths = 1
         plane_indices = {0}
         assert z_fields.size == n_depths
         bidirection_z = False
     else:
-        bidirection_z = (
-            xml_root.find(".//Sequence").attrib.get("bidirectionalZ") == "True"
-        )
-
         # One "Frame" per depth in the .xml file. Gets number of frames in first sequence
-        planes = [
-            int(plane.attrib.get("index"))
-            for plane in xml_root.findall(".//Sequence/[@cycle='1']/Frame")
-        ]
         plane_indices = set(planes)
         n_depths = len(plane_indices)
 
-        z_controllers = xml_root.findall(
-            ".//Sequence/[@cycle='2']/Frame/[@index='1']/PVStateShard/PVStateValue/[@key='positionCurrent']/SubindexedValues/[@index='ZAxis']/SubindexedValue"
-        )
-
         # If more than one Z-axis controllers are found,
         # check which controller is changing z_field depth. Only 1 controller
         # must change depths.
-        if len(z_controllers) > 1:
-            z_repeats = []
-            for controller in xml_root.findall(
-                ".//Sequence/[@cycle='2']/Frame/[@index='1']/PVStateShard/PVStateValue/[@key='positionCurrent']/SubindexedValues/[@index='ZAxis']/"
-            ):
-                z_repeats.append(
-                    [
-                        float(z.attrib.get("value"))
-                        for z in xml_root.findall(
-                            ".//Sequence/[@cycle='2']/Frame/PVStateShard/PVStateValue/[@key='positionCurrent']/SubindexedValues/[@index='ZAxis']/SubindexedValue/[@subindex='{0}']".format(
-                                controller.attrib.get("subindex")
-                            )
-                        )
-                    ]
-                )
+        if len(cycle2_z_controllers) > 1:
+            z_repeats = [
+                [float(z) for z in cycle2_z_values[subindex]]
+                for subindex in cycle2_z_controllers
+            ]
             controller_assert = [
                 not all(z == z_controller[0] for z in z_controller)
                 for z_controller in z_repeats
@@ -359,12 +1493,7 @@ def _extract_prairieview_metadata(xml_filepath: str):
             z_fields = z_repeats[controller_assert.index(True)]
 
         else:
-            z_fields = [
-                z.attrib.get("value")
-                for z in xml_root.findall(
-                    ".//Sequence/[@cycle='2']/Frame/PVStateShard/PVStateValue/[@key='positionCurrent']/SubindexedValues/[@index='ZAxis']/SubindexedValue/[@subindex='0']"
-                )
-            ]
+            z_fields = cycle2_z_values.get("0", [])
 
         assert (
             len(z_fields) == n_depths
@@ -398,7 +1527,48 @@ def _extract_prairieview_metadata(xml_filepath: str):
         plane_indices=list(plane_indices),
     )
 
-    return metainfo
+    frame_index, filenames = _build_frame_index(
+        frame_files, plane_indices=list(plane_indices), is_multiplane=cycle2_has_z
+    )
+
+    return metainfo, frame_index, filenames
+
+
+# One row per (cycle, frame index, plane, channel) File entry of the .xml file
+_frame_index_dtype = np.dtype(
+    [
+        ("cycle", np.int32),  # Sequence "cycle"
+        ("frame_index", np.int32),  # Frame "index"
+        ("plane", np.int32),  # plane index, as in `plane_indices`
+        ("channel", np.int32),  # File "channel"
+        ("file_id", np.int32),  # index into the filenames array
+        ("page", np.int32),  # 0-based page of the frame in the file
+        ("relative_time", np.float64),  # Frame "relativeTime"
+        ("absolute_time", np.float64),  # Frame "absoluteTime"
+    ]
+)
+
+
+def _build_frame_index(frame_files: list, plane_indices: list, is_multiplane: bool):
+    """Build the frame index table from the File entries collected from the .xml"""
+    frame_index = np.zeros(len(frame_files), dtype=_frame_index_dtype)
+    if not frame_files:
+        return frame_index, np.array([], dtype=str)
+
+    cycles, frame_indices, channels, files, pages, rel_times, abs_times = zip(
+        *frame_files
+    )
+    filenames, file_ids = np.unique(np.array(files), return_inverse=True)
+    frame_index["cycle"] = cycles
+    frame_index["frame_index"] = frame_indices
+    # single-plane ome.tif does not have "@index" under Frame to search for
+    frame_index["plane"] = frame_indices if is_multiplane else plane_indices[0]
+    frame_index["channel"] = channels
+    frame_index["file_id"] = file_ids
+    frame_index["page"] = np.array(pages) - 1  # "page" is 1-based
+    frame_index["relative_time"] = rel_times
+    frame_index["absolute_time"] = abs_times
+    return frame_index, filenames
 
 
 def get_prairieview_metadata(ome_tif_filepath: str) -> dict:
@@ -428,13 +1598,176 @@ def get_prairieview_metadata(ome_tif_filepath: str) -> dict:
     xml_files_list = pathlib.Path(ome_tif_filepath).parent.glob("*.xml")
 
     for file in xml_files_list:
-        xml_tree = ET.parse(file.as_posix())
-        xml_file = xml_tree.getroot()
-        if xml_file.find(".//Sequence"):
+        parsed_xml = _parse_prairieview_xml(file)
+        if parsed_xml is not None:
             break
     else:
         raise FileNotFoundError(
             f"No PrarieView metadata .xml file found at {pathlib.Path(ome_tif_filepath).parent}"
         )
 
-    return _extract_prairieview_metadata(file)
+    metainfo, _, _ = parsed_xml
+    return metainfo
+
+
+def _frame_index_cache_file(xml_filepath: Path) -> Path:
+    return xml_filepath.with_name(f".{xml_filepath.stem}_frame_index.npz")
+
+
+def _load_frame_index_cache(xml_filepath: Path):
+    """Return (metainfo, frame_index, filenames) from the cache, None if outdated"""
+    cache_file = _frame_index_cache_file(xml_filepath)
+    if not cache_file.exists():
+        return None
+    xml_stat = xml_filepath.stat()
+    try:
+        with np.load(cache_file, allow_pickle=True) as cache:
+            if (
+                cache["xml_mtime"] != xml_stat.st_mtime
+                or cache["xml_size"] != xml_stat.st_size
+            ):
+                return None
+            return cache["metainfo"].item(), cache["frame_index"], cache["filenames"]
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable frame index cache {cache_file}: {e}")
+        return None
+
+
+def _save_frame_index_cache(
+    xml_filepath: Path, metainfo: dict, frame_index: np.ndarray, filenames: np.ndarray
+):
+    cache_file = _frame_index_cache_file(xml_filepath)
+    xml_stat = xml_filepath.stat()
+    try:
+        np.savez(
+            cache_file,
+            metainfo=np.array(metainfo, dtype=object),
+            frame_index=frame_index,
+            filenames=filenames,
+            xml_mtime=xml_stat.st_mtime,
+            xml_size=xml_stat.st_size,
+        )
+    except OSError as e:
+        logger.warning(f"Unable to write frame index cache {cache_file}: {e}")
+
+
+def _summary_images_cache_file(xml_filepath: Path) -> Path:
+    return xml_filepath.with_name(f".{xml_filepath.stem}_summary_images.npz")
+
+
+def _load_summary_images_cache(xml_filepath: Path, preview_bin=None):
+    """Return the cached summary images, None if outdated or without the preview"""
+    cache_file = _summary_images_cache_file(xml_filepath)
+    if not cache_file.exists():
+        return None
+    xml_stat = xml_filepath.stat()
+    try:
+        with np.load(cache_file) as cache:
+            if (
+                cache["xml_mtime"] != xml_stat.st_mtime
+                or cache["xml_size"] != xml_stat.st_size
+                or cache["preview_bin"] != (preview_bin or 0)
+            ):
+                return None
+            image_names = ["mean_image", "max_image", "std_image"] + (
+                ["preview"] if preview_bin else []
+            )
+            return {
+                tuple(key): {name: cache[f"{name}_{i}"] for name in image_names}
+                for i, key in enumerate(cache["keys"].tolist())
+            }
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable summary images cache {cache_file}: {e}")
+        return None
+
+
+def _save_summary_images_cache(xml_filepath: Path, preview_bin, summary_images: dict):
+    cache_file = _summary_images_cache_file(xml_filepath)
+    xml_stat = xml_filepath.stat()
+    images = {
+        f"{name}_{i}": image
+        for i, key_images in enumerate(summary_images.values())
+        for name, image in key_images.items()
+    }
+    try:
+        np.savez(
+            cache_file,
+            keys=np.array(list(summary_images), dtype=int),
+            xml_mtime=xml_stat.st_mtime,
+            xml_size=xml_stat.st_size,
+            preview_bin=preview_bin or 0,
+            **images,
+        )
+    except OSError as e:
+        logger.warning(f"Unable to write summary images cache {cache_file}: {e}")
+
+
+_page_index_dtype = np.dtype(
+    [
+        ("file_id", np.int32),
+        ("page", np.int32),
+        ("offset", np.int64),
+        ("height", np.int32),
+        ("width", np.int32),
+        ("dtype", "S4"),
+    ]
+)
+
+
+def _index_tiff_pages(tffl: tifffile.TiffFile, file_id: int) -> np.ndarray:
+    """Page index rows (see `_page_index_dtype`) of a tiff file open with tifffile"""
+    page_index = np.empty(len(tffl.pages), dtype=_page_index_dtype)
+    for page_idx, page in enumerate(tffl.pages):
+        page_index[page_idx] = (
+            file_id,
+            page_idx,
+            page.dataoffsets[0] if page.is_final and len(page.shape) == 2 else -1,
+            *page.shape[:2],
+            page.dtype.newbyteorder(tffl.byteorder).str,
+        )
+    return page_index
+
+
+def _get_page_index_rows(page_index: np.ndarray, file_id: int) -> np.ndarray:
+    """Rows of `page_index` of the pages of a file, in page order"""
+    start, stop = np.searchsorted(page_index["file_id"], [file_id, file_id + 1])
+    return page_index[start:stop]
+
+
+def _read_indexed_page(f, index_row) -> np.ndarray:
+    """Read the image data of a page of open file `f`, at its page index offset"""
+    frame = np.empty(
+        (index_row["height"], index_row["width"]),
+        dtype=np.dtype(index_row["dtype"].decode()),
+    )
+    f.seek(index_row["offset"])
+    if f.readinto(memoryview(frame).cast("B")) != frame.nbytes:
+        raise ValueError(f"Truncated page data at offset {index_row['offset']}")
+    return frame if frame.dtype.isnative else frame.astype(frame.dtype.newbyteorder())
+
+
+def _page_index_cache_file(xml_filepath: Path) -> Path:
+    return xml_filepath.with_name(f".{xml_filepath.stem}_page_index.npz")
+
+
+def _load_page_index_cache(xml_filepath: Path):
+    """Return (page_index, file_stats) from the cache, file_stats is (size, mtime)"""
+    cache_file = _page_index_cache_file(xml_filepath)
+    if not cache_file.exists():
+        return None
+    try:
+        with np.load(cache_file) as cache:
+            return cache["page_index"], cache["file_stats"]
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable page index cache {cache_file}: {e}")
+        return None
+
+
+def _save_page_index_cache(
+    xml_filepath: Path, page_index: np.ndarray, file_stats: np.ndarray
+):
+    cache_file = _page_index_cache_file(xml_filepath)
+    try:
+        np.savez(cache_file, page_index=page_index, file_stats=file_stats)
+    except OSError as e:
+        logger.warning(f"Unable to write page index cache {cache_file}: {e}")
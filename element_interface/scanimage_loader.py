@@ -0,0 +1,220 @@
+import pathlib
+
+import numpy as np
+import tifffile
+
+from .scanimage_utils import read_scanimage_header
+
+
+class ScanImageTiff:
+    """Reader of the frames of one plane and channel of a ScanImage tiff file
+
+    ScanImage interleaves the pages of the planes and channels of a volume:
+    ch0-pln0-t0, ch1-pln0-t0, ch0-pln1-t0, ch1-pln1-t0, ..., ch0-pln0-t1, ...
+    (followed by the flyback frames of the fast-Z volumes). The layout is taken
+    from the header of the first page (see `read_scanimage_header`), so the page of
+    every frame is computed instead of indexed. For uncompressed files with evenly
+    spaced pages (as written by ScanImage), `get_movie` returns a read-only
+    strided view of a memory map of the file, reading only the pages of the
+    frames actually accessed.
+
+    Example:
+        > si_tiff = ScanImageTiff(scan_filepath)
+        > movie = si_tiff.get_movie(plane_idx=0, channel=1)  # (frame x height x width)
+        > mean_image = movie[:1000].mean(axis=0)
+    """
+
+    def __init__(self, tiff_filepath: str):
+        """Initialize ScanImageTiff reader
+
+        Args:
+            tiff_filepath (str): path to a ScanImage tiff file
+
+        Raises:
+            ValueError: pages of slow stacks are not interleaved by plane
+        """
+        self.tiff_filepath = pathlib.Path(tiff_filepath)
+        self.header = read_scanimage_header(self.tiff_filepath)
+
+        self.num_planes = 1
+        if _get_header_value(self.header, "SI_hStackManager_enable", default=True):
+            self.num_planes = int(
+                _get_header_value(
+                    self.header,
+                    "SI_hStackManager_actualNumSlices",
+                    "SI_hStackManager_numSlices",
+                    "SI5_stackNumSlices",
+                    default=1,
+                )
+            )
+        self.channels = np.atleast_1d(
+            _get_header_value(
+                self.header,
+                "SI_hChannels_channelSave",
+                "SI5_channelsSave",
+                default=1,
+            )
+        ).ravel()
+        is_fast_z = bool(
+            _get_header_value(
+                self.header, "SI_hFastZ_enable", "SI5_fastZEnable", default=False
+            )
+        ) or (_get_header_value(self.header, "SI_hStackManager_stackMode") == "fast")
+        if self.num_planes > 1 and not is_fast_z:
+            raise ValueError(
+                f"Slow stack ScanImage files are not supported: {self.tiff_filepath}"
+            )
+        self.num_flyback_frames = 0
+        if self.num_planes > 1 and _get_header_value(
+            self.header,
+            "SI_hFastZ_discardFlybackFrames",
+            "SI5_fastZDiscardFlybackFrames",
+            default=False,
+        ):
+            self.num_flyback_frames = int(
+                _get_header_value(
+                    self.header,
+                    "SI_hFastZ_numDiscardFlybackFrames",
+                    "SI5_fastZNumDiscardFrames",
+                    default=0,
+                )
+            )
+        self._read_page_layout()
+
+    @property
+    def pages_per_volume(self) -> int:
+        return (self.num_planes + self.num_flyback_frames) * len(self.channels)
+
+    @property
+    def is_memmappable(self) -> bool:
+        return self._page_stride is not None
+
+    def get_page_indices(self, plane_idx: int, channel: int) -> np.ndarray:
+        """Page indices of the frames of a plane and channel in the tiff file
+
+        Args:
+            plane_idx (int): plane index, from 0 to `num_planes` - 1
+            channel (int): channel number, one of `channels`
+
+        Returns:
+            page_indices (np.ndarray): page index of each frame
+        """
+        if not 0 <= plane_idx < self.num_planes:
+            raise ValueError(
+                f"plane_idx {plane_idx} out of range, {self.num_planes} planes"
+            )
+        if channel not in self.channels:
+            raise ValueError(
+                f"channel {channel} not saved, saved channels: {self.channels}"
+            )
+        first_page = plane_idx * len(self.channels) + int(
+            np.flatnonzero(self.channels == channel)[0]
+        )
+        return np.arange(first_page, self.num_pages, self.pages_per_volume)
+
+    def get_movie(self, plane_idx: int, channel: int) -> np.ndarray:
+        """Frames of a plane and channel, as a (frame x height x width) array
+
+        Args:
+            plane_idx (int): plane index, from 0 to `num_planes` - 1
+            channel (int): channel number, one of `channels`
+
+        Returns:
+            movie (np.ndarray): read-only memory-mapped view of the file if
+                `is_memmappable`, else the frames read into memory by tifffile
+        """
+        page_indices = self.get_page_indices(plane_idx, channel)
+        if not len(page_indices):
+            return np.empty((0, *self.frame_shape), dtype=self.dtype)
+        if not self.is_memmappable:
+            with tifffile.TiffFile(self.tiff_filepath.as_posix()) as tffl:
+                return tffl.asarray(key=page_indices.tolist()).reshape(
+                    (len(page_indices), *self.frame_shape)
+                )
+
+        if self._memmap is None:
+            self._memmap = np.memmap(
+                self.tiff_filepath,
+                dtype=np.uint8,
+                mode="r",
+                offset=self._data_offset,
+                shape=(self.num_pages - 1) * self._page_stride
+                + self.dtype.itemsize * int(np.prod(self.frame_shape)),
+            )
+        return np.ndarray(
+            shape=(len(page_indices), *self.frame_shape),
+            dtype=self.dtype,
+            buffer=self._memmap,
+            offset=int(page_indices[0]) * self._page_stride,
+            strides=(
+                self.pages_per_volume * self._page_stride,
+                self.frame_shape[1] * self.dtype.itemsize,
+                self.dtype.itemsize,
+            ),
+        )
+
+    def _read_page_layout(self):
+        """Read the frame shape, dtype, page count and data offset of the pages
+
+        Only the first, second and last page are read if the pages are evenly
+        spaced, all pages otherwise.
+        """
+        self._memmap = None
+        self._page_stride = None
+        with tifffile.TiffFile(self.tiff_filepath.as_posix()) as tffl:
+            first_page = tffl.pages.first
+            self.frame_shape = first_page.shape
+            self.dtype = first_page.dtype.newbyteorder(tffl.byteorder)
+            if len(self.frame_shape) != 2:
+                raise ValueError(
+                    f"Expected single-sample 2D pages in {self.tiff_filepath},"
+                    f" found shape {self.frame_shape}"
+                )
+            self._data_offset = first_page.dataoffsets[0]
+            frame_nbytes = self.dtype.itemsize * int(np.prod(self.frame_shape))
+
+            # predict the page count from the file size if evenly spaced pages
+            if first_page.is_final:
+                try:
+                    page_stride = tffl.pages[1].dataoffsets[0] - self._data_offset
+                except IndexError:  # single page
+                    self.num_pages, self._page_stride = 1, frame_nbytes
+                    return
+                if page_stride >= frame_nbytes:
+                    file_size = self.tiff_filepath.stat().st_size
+                    num_pages = (
+                        file_size - self._data_offset - frame_nbytes
+                    ) // page_stride + 1
+                    if self._is_page_at(
+                        tffl, num_pages - 1, self._data_offset, page_stride
+                    ) and not self._is_page_at(tffl, num_pages):
+                        self.num_pages, self._page_stride = num_pages, page_stride
+                        return
+
+            # otherwise index all the pages
+            self.num_pages = len(tffl.pages)
+            data_offsets = [page.dataoffsets[0] for page in tffl.pages]
+            if all(page.is_final for page in tffl.pages) and self.num_pages > 1:
+                page_strides = np.unique(np.diff(data_offsets))
+                if len(page_strides) == 1 and page_strides[0] >= frame_nbytes:
+                    self._page_stride = int(page_strides[0])
+
+    @staticmethod
+    def _is_page_at(tffl, page_idx, data_offset=None, page_stride=None) -> bool:
+        """Whether the page exists, with its data at the given offset if any"""
+        try:
+            page = tffl.pages[page_idx]
+        except IndexError:
+            return False
+        return data_offset is None or (
+            page.is_final
+            and page.dataoffsets[0] == data_offset + page_idx * page_stride
+        )
+
+
+def _get_header_value(header, *keys, default=None):
+    """Value of the first of `keys` in the ScanImage header, e.g. of different versions"""
+    for key in keys:
+        if key in header:
+            return header[key]
+    return default
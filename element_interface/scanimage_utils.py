@@ -1,5 +1,11 @@
+import functools
+import os
 import re
 from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import tifffile
 
 
 def parse_scanimage_header(scan):
@@ -16,15 +22,37 @@ def parse_scanimage_header(scan):
     Returns:
         header (dict): ScanImage header as key-value dictionary
     """
-    header = {}
-    for item in scan.header.split("\n"):
-        try:
-            key, value = item.split(" = ")
-            key = re.sub("^scanimage_", "", key.replace(".", "_"))
-            header[key] = value
-        except:  # noqa E722
-            pass  # TODO: remove bare except
-    return header
+    return _parse_header_lines(scan.header)
+
+
+def read_scanimage_header(tiff_filepath, typed=True):
+    """Read the ScanImage header of a tiff file from the tags of its first page
+
+    Only the tiff header and first image file directory are read, and the result is
+    memoized per file (until its size or modification time changes), so the
+    header of a large scan is read in milliseconds. The keys are those of
+    `parse_scanimage_header`.
+
+    Example:
+        > header = scanimage_utils.read_scanimage_header(scan_filepath)
+
+        > header["SI_hStackManager_numSlices"]
+
+    Args:
+        tiff_filepath (str): path to a ScanImage tiff file
+        typed (bool): parse the values to python/numpy values (bool, int, float,
+            str, or np.ndarray for MATLAB arrays), else keep them as strings
+
+    Returns:
+        header (dict): ScanImage header as key-value dictionary
+    """
+    tiff_filepath = Path(tiff_filepath).resolve()
+    file_stat = tiff_filepath.stat()
+    return dict(
+        _read_scanimage_header(
+            tiff_filepath.as_posix(), file_stat.st_size, file_stat.st_mtime_ns, typed
+        )
+    )
 
 
 def get_scanimage_acq_time(scan):
@@ -33,16 +61,82 @@ def get_scanimage_acq_time(scan):
     Example:
         > loaded_scan = scanreader.read_scan(scan_filepath)
 
-        > header = scanimage_utils.parse_scanimage_header(loaded_scan)
+        > recording_time = scanimage_utils.get_scanimage_acq_time(loaded_scan)
+
+        > recording_time = scanimage_utils.get_scanimage_acq_time(scan_filepath)
 
     Args:
-        scan (scanimage object): ScanImage object with header
+        scan (scanimage object): ScanImage object with header, or path to a
+            ScanImage tiff file (see `read_scanimage_header`)
 
     Returns:
         time (str): acquisition time in %Y %m %d %H %M %S format
     """
-    header = parse_scanimage_header(scan)
+    if isinstance(scan, (str, os.PathLike)):
+        header = read_scanimage_header(scan, typed=False)
+    else:
+        header = parse_scanimage_header(scan)
     recording_time = datetime.strptime(
         (header["epoch"][1:-1]).replace(",", " "), "%Y %m %d %H %M %S.%f"
     )
     return recording_time
+
+
+@functools.lru_cache(maxsize=4096)
+def _read_scanimage_header(tiff_filepath, file_size, file_mtime_ns, typed):
+    """Memoized on the file size and modification time, not used otherwise"""
+    with tifffile.TiffFile(tiff_filepath) as tffl:
+        page = tffl.pages.first
+        header_text = "\n".join(
+            tag.value
+            for tag in (page.tags.get("ImageDescription"), page.tags.get("Software"))
+            if tag is not None and isinstance(tag.value, str)
+        )
+    header = _parse_header_lines(header_text)
+    if typed:
+        header = {key: _parse_matlab_value(value) for key, value in header.items()}
+    return header
+
+
+def _parse_header_lines(header_text):
+    header = {}
+    for item in header_text.split("\n"):
+        key, sep, value = item.partition(" = ")
+        if not sep or " = " in value:
+            continue
+        key = re.sub("^scanimage_", "", key.replace(".", "_"))
+        header[key] = value
+    return header
+
+
+def _parse_matlab_value(value):
+    """Parse a MATLAB value of the header, returned as is if not recognized"""
+    value = value.strip()
+    if value in ("true", "false"):
+        return value == "true"
+    if len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    if len(value) >= 2 and value[0] == "[" and value[-1] == "]":
+        rows = [row.replace(",", " ").split() for row in value[1:-1].split(";")]
+        rows = [row for row in rows if row]
+        if len({len(row) for row in rows}) > 1:
+            return value
+        elements = [_parse_matlab_scalar(element) for row in rows for element in row]
+        if any(isinstance(element, str) for element in elements):
+            return value
+        array = np.array(elements)
+        return array if len(rows) <= 1 else array.reshape(len(rows), -1)
+    return _parse_matlab_scalar(value)
+
+
+def _parse_matlab_scalar(value):
+    if value in ("true", "false"):
+        return value == "true"
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
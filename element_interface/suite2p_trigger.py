@@ -1,6 +1,11 @@
+import json
+import multiprocessing
 import os
 import pathlib
+import pickle
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
 import numpy as np
 import suite2p
@@ -237,3 +242,472 @@ def deconvolution_suite2p(segmentation_ops: dict, db: dict) -> np.ndarray:
     )
 
     return spikes
+
+
+def run_suite2p_parallel_planes(
+    ops: dict, db: dict, n_workers: int = None, threads_per_plane: int = None
+) -> list:
+    """Run Suite2p with each plane processed in a separate worker process.
+
+    `suite2p.run_s2p()` converts the input to per-plane binary files and then
+    processes the planes one after another. Here the conversion is still done by
+    `suite2p.run_s2p()` (through its `multiplane_parallel` hook), but the
+    registration/detection/extraction of each plane (`suite2p.run_plane()`) runs in
+    its own process. The outputs follow the standard `suite2p/planeN` layout, plus
+    `suite2p/combined` for multi-plane data, and can be loaded with
+    `element_interface.suite2p_loader.Suite2p`.
+
+    Example:
+        > ops = dict(suite2p.default_ops(), nplanes=16, do_registration=1, roidetect=True)
+
+        > plane_ops = element_interface.suite2p_trigger.run_suite2p_parallel_planes(
+            ops, db, n_workers=8, threads_per_plane=4)
+
+    Args:
+        ops (dict): ops dictionary can be obtained by using `suite2p.default_ops()`
+            function. The `do_registration`, `roidetect` and `spikedetect` flags
+            select the steps run for each plane.
+        db (dict): dictionary that includes paths pointing towards the input
+            data, and path to store outputs
+        n_workers (int): number of planes processed concurrently.
+            Defaults to min(number of planes, number of cores).
+        threads_per_plane (int): number of threads each worker may use
+            (numba/OpenMP/MKL). Defaults to number of cores / n_workers.
+
+    Returns:
+        plane_ops (list): ops dictionary returned by `suite2p.run_plane()` for each
+            plane, sorted by plane index. Skipped flyback planes are not included.
+    """
+    s2p_ops = {**suite2p.default_ops(), **ops, **db}
+    n_cores = multiprocessing.cpu_count()
+    n_workers = n_workers or min(s2p_ops["nplanes"], n_cores)
+    threads_per_plane = threads_per_plane or max(1, n_cores // n_workers)
+
+    server = dict(
+        fnc=_run_planes_in_pool,
+        ops=s2p_ops,
+        n_workers=n_workers,
+        threads_per_plane=threads_per_plane,
+        plane_ops=[],
+    )
+    suite2p.run_s2p({**ops, "multiplane_parallel": True}, db, server=server)
+
+    return server["plane_ops"]
+
+
+def _run_planes_in_pool(save_folder: str, server: dict):
+    """`server["fnc"]` hook of `suite2p.run_s2p()`, called once the binaries exist."""
+    ops = server["ops"]
+    plane_folders = sorted(
+        (
+            f
+            for f in pathlib.Path(save_folder).iterdir()
+            if f.is_dir() and f.name.startswith("plane")
+        ),
+        key=lambda f: int(f.name.replace("plane", "")),
+    )
+    ops_paths = [
+        (f / "ops.npy").as_posix()
+        for plane_idx, f in enumerate(plane_folders)
+        if plane_idx not in ops["ignore_flyback"]
+    ]
+
+    print(
+        f"------------Running {len(ops_paths)} planes"
+        f" on {server['n_workers']} workers------------"
+    )
+    with _thread_limits(server["threads_per_plane"]), ProcessPoolExecutor(
+        max_workers=server["n_workers"],
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        futures = [
+            executor.submit(_run_plane, ops, ops_path, server["threads_per_plane"])
+            for ops_path in ops_paths
+        ]
+        server["plane_ops"].extend(future.result() for future in futures)
+
+    if len(plane_folders) > 1 and ops["combined"] and ops.get("roidetect", True):
+        print("------------Creating combined view------------")
+        suite2p.io.combined(save_folder, save=True)
+
+    if ops.get("save_NWB"):
+        print("------------Saving NWB file------------")
+        suite2p.io.save_nwb(save_folder)
+
+
+def _run_plane(ops: dict, ops_path: str, n_threads: int) -> dict:
+    """Run `suite2p.run_plane()` on one plane binary, in a worker process."""
+    plane_ops = np.load(ops_path, allow_pickle=True).item()
+    # same override rules as `suite2p.run_s2p()`, except "aspect" which
+    # `suite2p.run_s2p()` may have set from "diameter" in the plane ops
+    for key in suite2p.default_ops():
+        if key in ops and key not in (
+            "data_path",
+            "save_path0",
+            "fast_disk",
+            "save_folder",
+            "subfolders",
+            "aspect",
+        ):
+            plane_ops[key] = ops[key]
+    plane_ops["num_workers"] = n_threads
+
+    return suite2p.run_plane(plane_ops, ops_path=ops_path)
+
+
+_thread_env_vars = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMBA_NUM_THREADS",
+)
+
+
+@contextmanager
+def _thread_limits(n_threads: int):
+    """Cap the threads of processes spawned within this context.
+
+    The thread pools of numpy/numba are sized at import time, so the cap is set
+    in the environment inherited by the worker processes.
+    """
+    previous = {var: os.environ.get(var) for var in _thread_env_vars}
+    os.environ.update({var: str(n_threads) for var in _thread_env_vars})
+    try:
+        yield
+    finally:
+        for var, value in previous.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+class Suite2pPipeline:
+    """Run the Suite2p triggers as a sequence of stages, reusing valid outputs.
+
+    Each stage (`motion_correction`, `segmentation`, `deconvolution`) is identified
+    by a fingerprint of the ops keys relevant to that stage, plus the input files
+    (path, size, modification time) for motion correction, or the fingerprint of the
+    upstream stage otherwise. After a stage runs, its fingerprint, the sizes of its
+    output files and its returned results are saved in the Suite2p save folder as
+    `.{stage}_{fingerprint}.json` and `.{stage}_{fingerprint}_results.pickle`
+    (except the deconvolved traces, reloaded from their `spks.npy` output). On
+    a subsequent run, e.g. a retried DataJoint job, a stage is skipped if its
+    fingerprint is unchanged and all of its recorded outputs are still present with
+    the recorded sizes.
+
+    Example:
+        > pipeline = element_interface.suite2p_trigger.Suite2pPipeline(ops, db)
+
+        > results = pipeline.run()
+
+        > pipeline.reused_stages
+        ['motion_correction']
+
+    Attributes:
+        ops (dict): ops dictionary merged with `suite2p.default_ops()` and `db`
+        db (dict): dictionary that includes paths pointing towards the input data,
+            and path to store outputs
+        save_folder (pathlib.Path): Suite2p output folder (`save_path0/save_folder`)
+        reused_stages (list): stages skipped during the last `run()`
+        executed_stages (list): stages executed during the last `run()`
+    """
+
+    stages = ("motion_correction", "segmentation", "deconvolution")
+
+    stage_flags = {
+        "motion_correction": dict(
+            do_registration=1, roidetect=False, spikedetect=False
+        ),
+        "segmentation": dict(do_registration=0, roidetect=True, spikedetect=False),
+        "deconvolution": dict(do_registration=0, roidetect=False, spikedetect=True),
+    }
+
+    stage_ops_keys = {
+        "motion_correction": [
+            "nplanes",
+            "nchannels",
+            "functional_chan",
+            "align_by_chan",
+            "frames_include",
+            "ignore_flyback",
+            "force_sktiff",
+            "h5py_key",
+            "bruker",
+            "bruker_bidirectional",
+            "mesoscan",
+            "do_bidiphase",
+            "bidiphase",
+            "bidi_corrected",
+            "two_step_registration",
+            "keep_movie_raw",
+            "nimg_init",
+            "batch_size",
+            "maxregshift",
+            "subpixel",
+            "smooth_sigma_time",
+            "smooth_sigma",
+            "th_badframes",
+            "norm_frames",
+            "force_refImg",
+            "pad_fft",
+            "nonrigid",
+            "block_size",
+            "snr_thresh",
+            "maxregshiftNR",
+            "1Preg",
+            "spatial_hp_reg",
+            "pre_smooth",
+            "spatial_taper",
+        ],
+        "segmentation": [
+            "fs",
+            "tau",  # detection bins tau * fs frames
+            "batch_size",
+            "sparse_mode",
+            "spatial_scale",
+            "connected",
+            "nbinned",
+            "max_iterations",
+            "threshold_scaling",
+            "max_overlap",
+            "high_pass",
+            "spatial_hp_detect",
+            "denoise",
+            "anatomical_only",
+            "diameter",
+            "cellprob_threshold",
+            "flow_threshold",
+            "spatial_hp_cp",
+            "pretrained_model",
+            "soma_crop",
+            "neuropil_extract",
+            "inner_neuropil_radius",
+            "min_neuropil_pixels",
+            "lam_percentile",
+            "allow_overlap",
+            "use_builtin_classifier",
+            "classifier_path",
+            "preclassify",
+            "chan2_thres",
+        ],
+        "deconvolution": [
+            "baseline",
+            "win_baseline",
+            "sig_baseline",
+            "fs",
+            "prctile_baseline",
+            "batch_size",
+            "tau",
+            "neucoeff",
+        ],
+    }
+
+    # output files (per plane folder) of each stage. "ops.npy" is rewritten by
+    # every stage, so only its presence is checked.
+    stage_outputs = {
+        "motion_correction": ["ops.npy", "data.bin"],
+        "segmentation": ["ops.npy", "F.npy", "Fneu.npy", "iscell.npy", "stat.npy"],
+        "deconvolution": ["spks.npy"],
+    }
+
+    # stages whose results are reloaded from one of their output files (in the
+    # plane "save_path" folder) instead of being pickled
+    stage_result_files = {"deconvolution": "spks.npy"}
+
+    def __init__(self, ops: dict, db: dict):
+        """Initialize Suite2pPipeline class
+
+        Args:
+            ops (dict): ops dictionary can be obtained by using `suite2p.default_ops()`
+            db (dict): dictionary that includes paths pointing towards the input
+                data, and path to store outputs
+        """
+        self.ops = {**suite2p.default_ops(), **ops, **db}
+        self.db = db
+
+        # same defaults as `suite2p.run_s2p()`
+        save_path0 = self.ops.get("save_path0") or (
+            pathlib.Path(self.ops["h5py"][0]).parent
+            if self.ops.get("h5py")
+            else self.ops["data_path"][0]
+        )
+        self.save_folder = pathlib.Path(save_path0) / (
+            self.ops.get("save_folder") or "suite2p"
+        )
+
+        self.reused_stages = []
+        self.executed_stages = []
+
+    def run(self, stages: list = None, force: bool = False) -> dict:
+        """Run the requested stages in order, skipping those with valid outputs.
+
+        Args:
+            stages (list): subset of `Suite2pPipeline.stages` to run.
+                Defaults to all stages.
+            force (bool): if True, run all requested stages regardless of
+                existing outputs
+
+        Returns:
+            results (dict): stage name mapped to the value returned by the
+                corresponding trigger function (`motion_correction_suite2p`,
+                `segmentation_suite2p`, `deconvolution_suite2p`)
+        """
+        stages = stages or self.stages
+        assert set(stages).issubset(self.stages), f"Invalid stages: {stages}"
+
+        self.reused_stages = []
+        self.executed_stages = []
+        results = {}
+        stage_ops = {}
+        for stage, fingerprint in self.fingerprints().items():
+            if stage not in stages:
+                # carry the ops of a previously completed stage downstream
+                if stage not in self.stage_result_files:
+                    result = self._load_results(stage, fingerprint)
+                    if isinstance(result, dict):
+                        stage_ops = result
+                continue
+
+            # the upstream results do not override the ops of this stage, e.g.
+            # "tau" returned by a reused segmentation run
+            stage_ops = {
+                **self.ops,
+                **stage_ops,
+                **{k: self.ops[k] for k in self.stage_ops_keys[stage] if k in self.ops},
+                **self.stage_flags[stage],
+            }
+            result = None if force else self._load_results(stage, fingerprint)
+            if result is not None:
+                print(f"------------Reusing existing {stage} results------------")
+                self.reused_stages.append(stage)
+            else:
+                result = self._run_stage(stage, stage_ops, fingerprint)
+                self.executed_stages.append(stage)
+
+            results[stage] = result
+            if isinstance(result, dict):
+                stage_ops = result
+
+        return results
+
+    def fingerprints(self) -> dict:
+        """Return the fingerprint (UUID) of each stage, chained to its upstream stage.
+
+        Returns:
+            fingerprints (dict): stage name mapped to its fingerprint
+        """
+        from .utils import dict_to_uuid  # utils requires datajoint
+
+        fingerprints = {}
+        upstream = self._input_files()
+        for stage in self.stages:
+            upstream = fingerprints[stage] = dict_to_uuid(
+                {
+                    "stage": stage,
+                    "ops": {k: self.ops.get(k) for k in self.stage_ops_keys[stage]},
+                    "upstream": upstream,
+                },
+                legacy=False,
+            )
+        return fingerprints
+
+    def _run_stage(self, stage, stage_ops, fingerprint):
+        trigger = {
+            "motion_correction": motion_correction_suite2p,
+            "segmentation": segmentation_suite2p,
+            "deconvolution": deconvolution_suite2p,
+        }[stage]
+        # invalidate previous records of this stage and all downstream stages
+        for downstream_stage in self.stages[self.stages.index(stage) :]:
+            for f in self.save_folder.glob(f".{downstream_stage}_*"):
+                f.unlink()
+
+        result = trigger(stage_ops, self.db)
+
+        meta = {
+            "fingerprint": str(fingerprint),
+            "output_files": self._output_files(stage),
+        }
+        if stage in self.stage_result_files:
+            result_fp = (
+                pathlib.Path(stage_ops["save_path"]) / self.stage_result_files[stage]
+            )
+            try:
+                result_fp = result_fp.relative_to(self.save_folder)
+            except ValueError:
+                pass
+            meta["result_file"] = result_fp.as_posix()
+        else:
+            with open(
+                self.save_folder / f".{stage}_{fingerprint}_results.pickle", "wb"
+            ) as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(self.save_folder / f".{stage}_{fingerprint}.json", "w") as f:
+            json.dump(meta, f)
+
+        return result
+
+    def _load_results(self, stage, fingerprint):
+        """Return the saved results of a stage if its outputs are valid, else None."""
+        meta_fp = self.save_folder / f".{stage}_{fingerprint}.json"
+        results_fp = self.save_folder / f".{stage}_{fingerprint}_results.pickle"
+        if not meta_fp.exists():
+            return None
+
+        with open(meta_fp, "r") as f:
+            meta = json.load(f)
+        output_files = meta["output_files"]
+        if not output_files or self._output_files(stage) != output_files:
+            return None
+
+        if "result_file" in meta:
+            result_fp = self.save_folder / meta["result_file"]
+            return np.load(result_fp) if result_fp.exists() else None
+        if not results_fp.exists():
+            return None
+        with open(results_fp, "rb") as f:
+            return pickle.load(f)
+
+    def _output_files(self, stage):
+        """Relative path mapped to size (None for `ops.npy`) of the stage outputs."""
+        output_files = {}
+        for output_name in self.stage_outputs[stage]:
+            if output_name == "data.bin" and self.ops["delete_bin"]:
+                continue
+            for f in self.save_folder.glob(f"plane*/{output_name}"):
+                output_files[f.relative_to(self.save_folder).as_posix()] = (
+                    None if output_name == "ops.npy" else f.stat().st_size
+                )
+        return output_files
+
+    def _input_files(self):
+        """Path mapped to (size, modification time) of the input data files."""
+        if self.ops.get("h5py"):
+            h5py_files = self.ops["h5py"]
+            input_files = [
+                pathlib.Path(f)
+                for f in ([h5py_files] if isinstance(h5py_files, str) else h5py_files)
+            ]
+        else:
+            input_files = []
+            for data_dir in self.ops["data_path"]:
+                data_dir = pathlib.Path(data_dir)
+                search_dirs = [data_dir]
+                if self.ops["look_one_level_down"]:
+                    search_dirs += (
+                        [data_dir / d for d in self.ops["subfolders"]]
+                        if len(self.ops["subfolders"])
+                        else [d for d in data_dir.iterdir() if d.is_dir()]
+                    )
+                input_files += [
+                    f
+                    for d in search_dirs
+                    for f in d.iterdir()
+                    if f.is_file()
+                    and f.suffix.lower() in (".tif", ".tiff", ".h5", ".hdf5", ".sbx")
+                ]
+
+        return {
+            f.as_posix(): (f.stat().st_size, f.stat().st_mtime) for f in input_files
+        }
@@ -4,10 +4,13 @@ import logging
 import os
 import pathlib
 import sys
+import time
 import uuid
 import json
 import pickle
 from datetime import datetime
+
+import numpy as np
 from datajoint.utils import to_camel_case
 
 logger = logging.getLogger("datajoint")
@@ -86,6 +89,183 @@ def find_root_directory(root_directories: list, full_path: str) -> pathlib.Posix
         )
 
 
+def find_full_paths(
+    root_directories: list,
+    relative_paths: list,
+    cache_ttl: float = 60.0,
+    raise_missing: bool = True,
+) -> list:
+    """Batch version of `find_full_path`, for many relative paths
+
+    Each directory is listed once and its content cached for `cache_ttl` seconds,
+    instead of testing the existence of each path under each root. The listings
+    only confirm the paths they contain, the existence of the others is tested, so
+    files created after their directory was listed are found.
+
+    Args:
+        root_directories (list): potential root directories
+        relative_paths (list): relative paths to find the valid root directory of
+        cache_ttl (float): seconds the content of a listed directory is reused
+        raise_missing (bool): raise if a full path is not found, else return None
+
+    Returns:
+        full-paths (list of pathlib.Path object), in the order of `relative_paths`
+
+    Raises:
+        FileNotFoundError: No valid full path
+    """
+    if isinstance(root_directories, (str, pathlib.Path)):
+        root_directories = [root_directories]
+    root_paths = [_to_Path(root_dir) for root_dir in root_directories]
+
+    # listings of the parent directory of the relative paths, as is then in each root
+    parent_listings = {}
+    full_paths = []
+    for relative_path in relative_paths:
+        relative_path = _to_Path(relative_path)
+        parent = relative_path.parent
+        if parent not in parent_listings:
+            parent_listings[parent] = []
+            for directory in (parent, *(root / parent for root in root_paths)):
+                listing = _directory_cache.list_directory(directory, cache_ttl)
+                # skip the directories missing for the rest of this call only
+                if listing is not None or directory.exists():
+                    parent_listings[parent].append((directory, listing))
+        full_path = next(
+            (
+                directory / relative_path.name
+                for directory, listing in parent_listings[parent]
+                if _directory_cache.is_listed(listing, directory, relative_path.name)
+            ),
+            None,
+        )
+        if full_path is None and raise_missing:
+            raise FileNotFoundError(
+                "No valid full-path found (from {})"
+                " for {}".format(root_directories, relative_path)
+            )
+        full_paths.append(full_path)
+    return full_paths
+
+
+def find_root_directories(
+    root_directories: list,
+    full_paths: list,
+    cache_ttl: float = 60.0,
+    raise_missing: bool = True,
+) -> list:
+    """Batch version of `find_root_directory`, for many full paths
+
+    The roots are matched against the parents of each path in a prefix tree of
+    their path components, and the existence of the paths is tested as in
+    `find_full_paths`.
+
+    Args:
+        root_directories (list): potential root directories
+        full_paths (list): full paths to search the root directory of
+        cache_ttl (float): seconds the content of a listed directory is reused
+        raise_missing (bool): raise if a path does not exist or has no root
+            directory, else return None
+
+    Returns:
+        root_directories (list of pathlib.Path object), in the order of `full_paths`
+
+    Raises:
+        FileNotFoundError: Full path does not exist
+        FileNotFoundError: No valid root directory
+    """
+    if isinstance(root_directories, (str, pathlib.Path)):
+        root_directories = [root_directories]
+
+    # prefix tree of the root path components, "" maps to the first root order
+    root_tree = {}
+    for root_order, root_dir in enumerate(root_directories):
+        node = root_tree
+        for part in _to_Path(root_dir).parts:
+            node = node.setdefault(part, {})
+        node.setdefault("", root_order)
+
+    root_paths = []
+    for full_path in full_paths:
+        full_path = _to_Path(full_path)
+        if not _directory_cache.exists(full_path, cache_ttl):
+            if raise_missing:
+                raise FileNotFoundError(f"{full_path} does not exist!")
+            root_paths.append(None)
+            continue
+
+        # first root (in the given order) among the parents of full_path
+        root_order, node = None, root_tree
+        for part in full_path.parts[:-1]:
+            node = node.get(part)
+            if node is None:
+                break
+            if "" in node and (root_order is None or node[""] < root_order):
+                root_order = node[""]
+        if root_order is None and raise_missing:
+            raise FileNotFoundError(
+                "No valid root directory found (from {})"
+                " for {}".format(root_directories, full_path)
+            )
+        root_paths.append(
+            None if root_order is None else _to_Path(root_directories[root_order])
+        )
+    return root_paths
+
+
+class _DirectoryCache:
+    """Existence of paths, from cached listings of their parent directory
+
+    A listing is only trusted for the names it contains: names not listed (e.g.
+    created since the listing, or differing in case) are tested with `exists()`.
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._listings = {}  # directory: (listing time, listing)
+
+    def exists(self, path: pathlib.Path, ttl: float) -> bool:
+        return self.is_listed(
+            self.list_directory(path.parent, ttl), path.parent, path.name
+        )
+
+    @staticmethod
+    def is_listed(listing, directory: pathlib.Path, name: str) -> bool:
+        """Whether `name` exists in `directory`, given the listing of the directory"""
+        if listing is not None and name in listing:
+            return True
+        # unlisted names may still exist, e.g. new files, ".." or different case
+        return (directory / name).exists()
+
+    def clear(self):
+        self._listings.clear()
+
+    def list_directory(self, directory: pathlib.Path, ttl: float):
+        """Names of the directory entries, None if unlistable (not cached)"""
+        now = time.monotonic()
+        listing_time, listing = self._listings.get(directory, (None, None))
+        if listing_time is not None and now - listing_time < ttl:
+            return listing
+        try:
+            with os.scandir(directory) as entries:
+                listing = {entry.name for entry in entries}
+        except OSError:  # not found, or not a directory, not cached
+            return None
+        if len(self._listings) >= self.maxsize:
+            self._listings = {
+                key: value
+                for key, value in self._listings.items()
+                if now - value[0] < ttl
+            }
+            if len(self._listings) >= self.maxsize:
+                self._listings.clear()
+        self._listings[directory] = now, listing
+        return listing
+
+
+_directory_cache = _DirectoryCache()
+
+
 def _to_Path(path: str) -> pathlib.Path:
     """Convert the input "path" into a pathlib.Path object
 
@@ -97,16 +277,85 @@ def _to_Path(path: str) -> pathlib.Path:
     return pathlib.Path(str(path).replace("\\", "/"))
 
 
-def dict_to_uuid(key: dict):
+def dict_to_uuid(key: dict, legacy: bool = True):
     """Given a dictionary `key`, returns a hash string as UUID
 
+    By default, the MD5 hash of `str()` of the sorted keys and values, as stored
+    e.g. for paramset hashes. With `legacy=False`, the dictionary is hashed
+    (SHA-256, hardware accelerated on most CPUs) from a canonical serialization of
+    its content: nested dicts in sorted key order, lists and tuples element by
+    element, and numpy arrays from their dtype, shape and data buffer (not copied
+    if contiguous), so that arrays are hashed in full and numpy scalars hash as the
+    equal python scalars. The two UUIDs of a dictionary differ.
+
     Args:
-        key (dict): Any python dictionary"""
-    hashed = hashlib.md5()
-    for k, v in sorted(key.items()):
-        hashed.update(str(k).encode())
-        hashed.update(str(v).encode())
-    return uuid.UUID(hex=hashed.hexdigest())
+        key (dict): Any python dictionary
+        legacy (bool): return the MD5-based UUID of element-interface <= 0.7, else
+            the UUID of the canonical serialization
+    """
+    if legacy:
+        hashed = hashlib.md5()
+        for k, v in sorted(key.items()):
+            hashed.update(str(k).encode())
+            hashed.update(str(v).encode())
+        return uuid.UUID(hex=hashed.hexdigest())
+
+    hashed = hashlib.sha256()
+    _update_hash(hashed, key)
+    return uuid.UUID(bytes=hashed.digest()[:16])
+
+
+def _update_hash(hashed, value):
+    """Update `hashed` with the canonical serialization of `value`"""
+    if isinstance(value, np.generic):
+        value = value.item()
+
+    if value is None or isinstance(value, (bool, int, float, complex)):
+        _update_hash_str(hashed, b"n", repr(value))
+    elif isinstance(value, str):
+        _update_hash_str(hashed, b"s", value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        hashed.update(b"b" + len(value).to_bytes(8, "little"))
+        hashed.update(value)
+    elif isinstance(value, dict):
+        hashed.update(b"d" + len(value).to_bytes(8, "little"))
+        for k in sorted(value, key=lambda k: (type(k).__name__, str(k))):
+            _update_hash(hashed, k)
+            _update_hash(hashed, value[k])
+    elif isinstance(value, (list, tuple)):
+        hashed.update(
+            (b"l" if isinstance(value, list) else b"t")
+            + len(value).to_bytes(8, "little")
+        )
+        for element in value:
+            _update_hash(hashed, element)
+    elif isinstance(value, (set, frozenset)):
+        hashed.update(b"e" + len(value).to_bytes(8, "little"))
+        for element_digest in sorted(
+            dict_to_uuid({"": element}, legacy=False).bytes for element in value
+        ):
+            hashed.update(element_digest)
+    elif isinstance(value, np.ndarray):
+        _update_hash_str(hashed, b"a", f"{value.dtype.str}{value.shape}")
+        if value.dtype.hasobject:
+            _update_hash(hashed, value.ravel().tolist())
+        else:
+            hashed.update(np.ascontiguousarray(value).reshape(-1).view(np.uint8))
+    elif isinstance(value, pathlib.PurePath):
+        _update_hash_str(hashed, b"p", value.as_posix())
+    elif isinstance(value, uuid.UUID):
+        hashed.update(b"u" + value.bytes)
+    else:
+        _update_hash_str(
+            hashed, b"o", f"{type(value).__module__}.{type(value).__qualname__}"
+        )
+        _update_hash_str(hashed, b"", str(value))
+
+
+def _update_hash_str(hashed, tag: bytes, value: str):
+    encoded = value.encode()
+    hashed.update(tag + len(encoded).to_bytes(8, "little"))
+    hashed.update(encoded)
 
 
 def ingest_csv_to_table(
@@ -211,7 +460,7 @@ def memoized_result(uniqueness_dict: dict, output_directory: str):
     def decorator(func):
         def wrapped(*args, **kwargs):
             output_dir = _to_Path(output_directory)
-            input_hash = dict_to_uuid(uniqueness_dict)
+            input_hash = dict_to_uuid(uniqueness_dict, legacy=False)
             input_hash_fp = output_dir / f".{input_hash}.json"
             # check if results already exist (from previous identical run)
             output_dir_files_hash = dict_to_uuid(
@@ -219,7 +468,8 @@ def memoized_result(uniqueness_dict: dict, output_directory: str):
                     f.relative_to(output_dir).as_posix(): f.stat().st_size
                     for f in output_dir.rglob("*")
                     if f.name != f".{input_hash}.json"
-                }
+                },
+                legacy=False,
             )
             if input_hash_fp.exists():
                 with open(input_hash_fp, "r") as f:
@@ -243,7 +493,8 @@ def memoized_result(uniqueness_dict: dict, output_directory: str):
                         f.relative_to(output_dir).as_posix(): f.stat().st_size
                         for f in output_dir.rglob("*")
                         if f.name != f".{input_hash}.json"
-                    }
+                    },
+                    legacy=False,
                 ),
                 "start_time": start_time,
                 "completion_time": datetime.utcnow(),